@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+# Below this many chunks exact search is already sub-millisecond and ANN only costs recall
+ANN_MIN_ROWS = 20000
+# Inverted lists probed per query: the recall/latency knob. More lists = higher recall, slower
+DEFAULT_N_PROBE = 8
+KMEANS_ITERATIONS = 20
+# Points per centroid used to train k-means; training on the full corpus buys nothing
+TRAIN_POINTS_PER_LIST = 256
+
+
+def ivf_path(index_path):
+    return os.path.splitext(index_path)[0] + ".ivf.npz"
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def spherical_kmeans(matrix, n_lists, n_iter=KMEANS_ITERATIONS, seed=0):
+    # k-means on the unit sphere: assign by max dot product, recenter to the normalized mean
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(len(matrix), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = np.argmax(matrix @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, matrix)
+        counts = np.bincount(assignments, minlength=n_lists)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists from random points so every list stays in use
+            sums[empty] = matrix[rng.choice(len(matrix), int(empty.sum()), replace=False)]
+        centroids = _normalize_rows(sums)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """Inverted-file index: k-means centroids plus the rows assigned to each.
+
+    A query is compared against the centroids, and only the rows in the n_probe
+    closest lists are scored exactly. Rows are stored as one permutation (order)
+    with list boundaries (offsets), so a list is a contiguous slice.
+    """
+
+    def __init__(self, centroids, order, offsets, n_rows, n_probe=DEFAULT_N_PROBE):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.n_rows = n_rows
+        self.n_probe = n_probe
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, n_probe=DEFAULT_N_PROBE, n_iter=KMEANS_ITERATIONS, seed=0):
+        matrix = _normalize_rows(np.asarray(matrix, dtype=np.float32))
+        if n_lists is None:
+            # ~sqrt(n) lists balances centroid scoring against list scanning
+            n_lists = max(1, int(np.sqrt(len(matrix))))
+        n_lists = min(n_lists, len(matrix))
+        rng = np.random.default_rng(seed)
+        train_size = min(len(matrix), n_lists * TRAIN_POINTS_PER_LIST)
+        train = matrix[rng.choice(len(matrix), train_size, replace=False)]
+        centroids = spherical_kmeans(train, n_lists, n_iter=n_iter, seed=seed)
+
+        # Assign the full corpus in blocks to bound the temporary score matrix
+        assignments = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), 8192):
+            block = matrix[start:start + 8192]
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+        return cls(centroids, order, offsets, len(matrix), n_probe=n_probe)
+
+    def candidates(self, query, n_probe=None):
+        # Row ids in the n_probe lists whose centroids best match the (unit) query
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        centroid_scores = self.centroids @ query
+        lists = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        return np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, order=self.order, offsets=self.offsets,
+                 n_rows=self.n_rows, n_probe=self.n_probe)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["centroids"], data["order"], data["offsets"], int(data["n_rows"]), int(data["n_probe"]))
+
+
+def load_ivf(index_path, n_rows, dim):
+    # Returns the persisted IVF index for index_path, or None if missing or built for a different matrix
+    path = ivf_path(index_path)
+    if not os.path.exists(path):
+        return None
+    ivf = IVFIndex.load(path)
+    if ivf.n_rows != n_rows or ivf.centroids.shape[1] != dim:
+        print(f"Warning: ignoring stale {path} (built for {ivf.n_rows} rows); rebuild with `python ann_index.py`.",
+              flush=True)
+        return None
+    return ivf
+
+
+def recall_at_k(engine, queries, top_k=10, n_probe=None):
+    # Fraction of the exact top-k that the ANN search also returns, averaged over queries
+    exact = engine.search_ids_batch(queries, top_k, exact=True)
+    approx = engine.search_ids_batch(queries, top_k, n_probe=n_probe)
+    found = [
+        len({i for i, _ in a} & {i for i, _ in e}) / max(len(e), 1)
+        for a, e in zip(approx, exact)
+    ]
+    return float(np.mean(found))
+
+
+if __name__ == "__main__":
+    # Build and persist the IVF index for the corpus, then report recall@k and latency per n_probe
+    from retrieval import RetrievalEngine
+    from vector_store import INDEX_PATH, load_index
+
+    index_path = sys.argv[1] if len(sys.argv) > 1 else INDEX_PATH
+    index = load_index(index_path)
+    started = time.perf_counter()
+    ivf = IVFIndex.build(index.vectors)
+    ivf.save(ivf_path(index_path))
+    print(f"Built {ivf.n_lists} lists over {ivf.n_rows} rows in {time.perf_counter() - started:.2f}s -> {ivf_path(index_path)}")
+
+    engine = RetrievalEngine(index.vectors, index.texts, ann=ivf)
+    # Perturbed corpus rows stand in for real queries
+    rng = np.random.default_rng(0)
+    sample = np.asarray(index.vectors[rng.choice(len(index), min(200, len(index)), replace=False)])
+    queries = sample + rng.normal(scale=0.02, size=sample.shape).astype(np.float32)
+    started = time.perf_counter()
+    engine.search_ids_batch(queries, 10, exact=True)
+    exact_ms = (time.perf_counter() - started) / len(queries) * 1000
+    print(f"exact          recall@10=1.000  {exact_ms:.3f} ms/query")
+    for n_probe in sorted({1, 2, 4, 8, 16, 32} | {ivf.n_probe}):
+        if n_probe > ivf.n_lists:
+            continue
+        started = time.perf_counter()
+        engine.search_ids_batch(queries, 10, n_probe=n_probe)
+        ann_ms = (time.perf_counter() - started) / len(queries) * 1000
+        recall = recall_at_k(engine, queries, top_k=10, n_probe=n_probe)
+        print(f"n_probe={n_probe:<5}  recall@10={recall:.3f}  {ann_ms:.3f} ms/query")
@@ -0,0 +1,72 @@
+import atexit
+import queue
+import threading
+
+MAX_PENDING = 1000
+
+
+class BackgroundWriter:
+    """Runs deferred side effects (DB writes, notifications) on one worker thread.
+
+    Work is executed in submission order, which also serializes writes to SQLite.
+    The queue is bounded: if the worker falls far behind, submit() drops the task
+    rather than letting memory grow without limit. It never blocks, because it is
+    called from the event loop that streams every conversation; everything
+    submitted here is a cache write or other best-effort work.
+    """
+
+    def __init__(self, name="background-writer", max_pending=MAX_PENDING):
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                fn, args, kwargs = item
+                try:
+                    fn(*args, **kwargs)
+                except Exception as e:
+                    print(f"Background task {getattr(fn, '__name__', fn)} failed: {e}", flush=True)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, fn, *args, **kwargs):
+        # Returns False when the queue is full and the task was dropped
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                dropped = self.dropped
+            print(f"{self.name} is {self._queue.maxsize} tasks behind; dropped "
+                  f"{getattr(fn, '__name__', fn)} ({dropped} dropped so far)", flush=True)
+            return False
+        return True
+
+    def flush(self):
+        # Blocks until everything submitted so far has run
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+writer = BackgroundWriter()
+# Let pending cache writes land before the interpreter exits
+atexit.register(writer.close)
@@ -0,0 +1,64 @@
+"""Measures import-to-ready latency of resume_bot with the network disabled.
+
+Each run is a fresh interpreter, so module imports and the index load are cold
+(apart from the OS page cache). Any attempt to open a socket fails the run,
+which is how a startup-path network call would show up. Runs that counted tokens
+with the character estimate, because the tokenizer isn't cached locally (`python
+prompting.py` fetches it), are reported next to the timings.
+
+    python bench_startup.py [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CHILD = r"""
+import json, os, socket, time
+
+def no_network(*args, **kwargs):
+    raise OSError("network disabled for startup benchmark")
+
+socket.socket.connect = no_network
+socket.create_connection = no_network
+socket.getaddrinfo = no_network
+# Clients only need a key to be constructed; nothing is sent
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")
+
+started = time.perf_counter()
+import resume_bot
+imported = time.perf_counter()
+resume_bot.get_me()
+ready = time.perf_counter()
+from prompting import using_token_estimate
+print(json.dumps({"import": imported - started, "ready": ready - started, "estimate": using_token_estimate()}))
+"""
+
+
+def run_once():
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup failed with the network disabled:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    samples = [run_once() for _ in range(runs)]
+    for key in ("import", "ready"):
+        values = [sample[key] * 1000 for sample in samples]
+        print(f"{key:>6}: median {statistics.median(values):7.1f} ms  min {min(values):7.1f} ms  max {max(values):7.1f} ms  ({runs} runs)")
+    estimated = sum(1 for sample in samples if sample["estimate"])
+    if estimated:
+        print(f"Warning: {estimated}/{runs} runs estimated token counts; the tokenizer isn't in .tiktoken/ "
+              f"(run `python prompting.py` to time startup with it)")
+
+
+if __name__ == "__main__":
+    main()
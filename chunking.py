@@ -0,0 +1,168 @@
+import re
+
+from prompting import count_tokens
+
+# Chunk size and overlap are measured in tokens, the unit the prompt budget uses.
+# 120 tokens is about the 500 characters the fixed-size chunker used
+MAX_CHUNK_TOKENS = 120
+OVERLAP_TOKENS = 32
+
+BULLET_RE = re.compile(r"^\s*(?:[•●▪◦·\-*–]|\d{1,2}[.)])\s+")
+MARKDOWN_HEADING_RE = re.compile(r"^\s*#{1,6}\s+\S")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=\S)")
+WORD_RE = re.compile(r"\S+")
+
+
+def is_heading(line):
+    # Markdown headings, ALL-CAPS resume headings ("RELEVANT EXPERIENCE") and short
+    # label lines ending in a colon ("Projects:")
+    stripped = line.strip()
+    if not stripped or len(stripped) > 60 or BULLET_RE.match(line):
+        return False
+    if stripped[-1] in ".,;":
+        return False  # The wrapped tail of a sentence, e.g. "JPA."
+    if MARKDOWN_HEADING_RE.match(line):
+        return True
+    letters = [c for c in stripped if c.isalpha()]
+    if len(letters) >= 3 and all(c.isupper() for c in letters):
+        return True
+    return stripped.endswith(":") and len(stripped.split()) <= 5
+
+
+def heading_title(line):
+    return line.strip().lstrip("#").strip().rstrip(":").strip()
+
+
+def _lines(text):
+    # (start, end) of each line, without the newline
+    offset = 0
+    for line in text.split("\n"):
+        yield offset, offset + len(line)
+        offset += len(line) + 1
+
+
+def _trim(text, start, end):
+    # Shrink a span to exclude surrounding whitespace
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def parse_blocks(text):
+    """Splits a document into heading, bullet and paragraph blocks.
+
+    Returns (kind, start, end, section) tuples in document order. A bullet runs
+    until the next bullet, heading or blank line, so items that PDF extraction
+    wrapped over several lines stay whole.
+    """
+    blocks = []
+    section = ""
+    current = None  # [kind, start, end] of the block being extended
+
+    def close():
+        nonlocal current
+        if current:
+            start, end = _trim(text, current[1], current[2])
+            if start < end:
+                blocks.append((current[0], start, end, section))
+        current = None
+
+    for start, end in _lines(text):
+        line = text[start:end]
+        if not any(c.isalnum() for c in line):
+            # Blank lines and separators like "---" end the current block
+            close()
+        elif is_heading(line):
+            close()
+            section = heading_title(line)
+            trimmed = _trim(text, start, end)
+            blocks.append(("heading", trimmed[0], trimmed[1], section))
+        elif BULLET_RE.match(line):
+            close()
+            current = ["bullet", start, end]
+        elif current:
+            current[2] = end
+        else:
+            current = ["paragraph", start, end]
+    close()
+    return blocks
+
+
+def _split_long(text, start, end, max_tokens):
+    # Sentences of an oversized block, falling back to word windows for run-on sentences
+    spans = []
+    sentence_start = start
+    for match in SENTENCE_END_RE.finditer(text, start, end):
+        spans.append((sentence_start, match.start()))
+        sentence_start = match.end()
+    spans.append((sentence_start, end))
+
+    pieces = []
+    for span_start, span_end in spans:
+        if count_tokens(text[span_start:span_end]) <= max_tokens:
+            pieces.append((span_start, span_end))
+            continue
+        window_start = None
+        for word in WORD_RE.finditer(text, span_start, span_end):
+            if window_start is None:
+                window_start = word.start()
+            elif count_tokens(text[window_start:word.end()]) > max_tokens:
+                pieces.append((window_start, window_end))
+                window_start = word.start()
+            window_end = word.end()
+        if window_start is not None:
+            pieces.append((window_start, window_end))
+    return pieces
+
+
+def split_units(text, max_tokens=MAX_CHUNK_TOKENS):
+    # Smallest pieces a chunk is built from: whole blocks when they fit, else sentences
+    units = []
+    for kind, start, end, section in parse_blocks(text):
+        if kind == "heading" or count_tokens(text[start:end]) <= max_tokens:
+            units.append((kind, start, end, section))
+        else:
+            units.extend((kind, s, e, section) for s, e in _split_long(text, start, end, max_tokens))
+    return units
+
+
+def chunk_document(text, max_tokens=MAX_CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    """Packs a document's units into chunks of at most max_tokens.
+
+    Chunks never cross a heading, so each belongs to exactly one section, and a
+    paragraph after a run of bullets (the next job or project entry) starts a
+    new chunk. When an entry needs more than one chunk, the next chunk repeats
+    trailing units of the previous one (up to overlap_tokens) so context at the
+    boundary isn't lost. Returns (start, end, section) spans into text.
+    """
+    chunks = []
+    current = []  # (start, end, tokens, is_content) of the units in the chunk being filled
+    section = None
+    previous_kind = None
+
+    def emit():
+        # A heading with nothing under it yet isn't worth a chunk of its own
+        if any(unit[3] for unit in current):
+            chunks.append((current[0][0], current[-1][1], section))
+
+    for kind, start, end, unit_section in split_units(text, max_tokens):
+        tokens = count_tokens(text[start:end])
+        if kind == "heading" or unit_section != section or (kind == "paragraph" and previous_kind == "bullet"):
+            emit()
+            current = []
+            section = unit_section
+        elif current and sum(unit[2] for unit in current) + tokens > max_tokens:
+            emit()
+            overlap, total = [], 0
+            for unit in reversed(current):
+                if total + unit[2] > overlap_tokens or total + unit[2] + tokens > max_tokens:
+                    break
+                overlap.insert(0, unit)
+                total += unit[2]
+            current = overlap
+        current.append((start, end, tokens, kind != "heading"))
+        previous_kind = kind
+    emit()
+    return chunks
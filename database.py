@@ -1,107 +1,467 @@
 import sqlite3
+import json
 import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 
-def init_db():
-    # Use a path that works in both local and HF Spaces environments
-    db_path = os.path.join(os.path.dirname(__file__), 'me', 'db.sqlite')
-    # Ensure the directory exists
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    
-    # Table for tracking sessions and question limits
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT UNIQUE,
-            questions_asked INTEGER DEFAULT 0
-        )
-    ''')
-    
-    # Table for storing known Q&A
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS qa (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            question TEXT UNIQUE,
-            answer TEXT
+# Use a path that works in both local and HF Spaces environments
+DB_PATH = os.path.join(os.path.dirname(__file__), 'me', 'db.sqlite')
+# Namespace of answers and unknown questions recorded before tenants existed
+DEFAULT_TENANT = "default"
+
+
+class ConnectionManager:
+    """Per-thread pool of long-lived SQLite connections.
+
+    Each thread keeps one connection open for as long as the thread lives instead
+    of reconnecting for every statement; it is closed when the thread exits. Connections run in WAL mode so readers never
+    block the writer, and wait on busy_timeout instead of failing with
+    "database is locked" when two sessions write at once.
+    """
+
+    def __init__(self, db_path=DB_PATH, busy_timeout_ms=5000, cache_size_kib=8192, synchronous="NORMAL"):
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kib = cache_size_kib
+        self.synchronous = synchronous
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = set()
+
+    def _connect(self):
+        # isolation_level=None leaves transaction control to transaction() below
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,
+            check_same_thread=False,
         )
-    ''')
-    
-    # Table for storing unknown questions
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS unknown_questions (
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        # Negative cache_size is in KiB rather than pages
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._lock:
+            self._connections.add(conn)
+        return conn
+
+    def _release(self, conn):
+        # Runs when the owning thread's local storage is collected, i.e. the thread
+        # exited. Streamlit starts a thread per rerun, so this is what bounds the pool
+        with self._lock:
+            if conn not in self._connections:
+                return
+            self._connections.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.ProgrammingError:
+            pass
+
+    def connection(self):
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            holder = _ConnectionHolder(self._connect())
+            weakref.finalize(holder, self._release, holder.conn)
+            self._local.holder = holder
+        return holder.conn
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        # Nested calls join the outer transaction
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        # BEGIN IMMEDIATE takes the write lock up front, so read-then-write
+        # sequences can't be interleaved with another writer
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+        self._local = threading.local()
+
+
+class _ConnectionHolder:
+    # Thread-local slot for a connection; sqlite3 connections can't be weakly referenced
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
+db = ConnectionManager()
+
+
+def transaction(immediate=False):
+    return db.transaction(immediate=immediate)
+
+
+def _ensure_column(conn, table, column, decl):
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# Bumped whenever normalize_question changes, so stored keys are recomputed once
+QUESTION_KEY_VERSION = 2
+# Stripped from the ends of words only: "C++", "C#" and "Node.js" keep their symbols
+EDGE_PUNCTUATION = "?!.,;:'\"()"
+
+
+def normalize_question(question):
+    # Canonical cache key: case-folded, whitespace collapsed, punctuation at the
+    # edges of words dropped. "What is MintLang?" == "what is  mintlang"
+    words = (word.strip(EDGE_PUNCTUATION) for word in question.casefold().split())
+    return " ".join(word for word in words if word)
+
+
+def _backfill_question_keys(conn):
+    # Migrates databases created before question_key existed, or keyed by an older
+    # normalize_question. Rows of one tenant that collapse to the same key keep the
+    # most recently written answer.
+    if conn.execute("PRAGMA user_version").fetchone()[0] < QUESTION_KEY_VERSION:
+        conn.execute("UPDATE qa SET question_key = NULL")
+        conn.execute(f"PRAGMA user_version = {QUESTION_KEY_VERSION}")
+    rows = conn.execute("SELECT id, tenant, question FROM qa WHERE question_key IS NULL ORDER BY id DESC").fetchall()
+    if not rows:
+        return
+    taken = set(conn.execute("SELECT tenant, question_key FROM qa WHERE question_key IS NOT NULL"))
+    for row_id, tenant, question in rows:
+        key = normalize_question(question or "")
+        if (tenant, key) in taken:
+            conn.execute("DELETE FROM qa WHERE id = ?", (row_id,))
+        else:
+            conn.execute("UPDATE qa SET question_key = ? WHERE id = ?", (key, row_id))
+            taken.add((tenant, key))
+
+
+def _rebuild_qa_for_tenants(conn):
+    # qa.question was UNIQUE when every answer belonged to one person; two tenants must be
+    # able to cache the same question. SQLite can't drop a constraint, so copy the table
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'qa'").fetchone()[0]
+    if "question TEXT UNIQUE" not in sql:
+        return
+    conn.execute('''
+        CREATE TABLE qa_new (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             question TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            answer TEXT,
+            embedding BLOB,
+            created_at REAL,
+            question_key TEXT,
+            tenant TEXT
         )
     ''')
-    
-    conn.commit()
-    conn.close()
+    conn.execute('''
+        INSERT INTO qa_new (id, question, answer, embedding, created_at, question_key, tenant)
+        SELECT id, question, answer, embedding, created_at, question_key, tenant FROM qa
+    ''')
+    conn.execute("DROP TABLE qa")
+    conn.execute("ALTER TABLE qa_new RENAME TO qa")
+
+
+def init_db():
+    # Ensure the directory exists
+    os.makedirs(os.path.dirname(db.db_path), exist_ok=True)
+    with transaction() as conn:
+        # Table for tracking sessions and question limits
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT UNIQUE,
+                questions_asked INTEGER DEFAULT 0
+            )
+        ''')
+
+        # Table for storing known Q&A, one namespace per tenant
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS qa (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT,
+                answer TEXT
+            )
+        ''')
+
+        # Columns added after the first release; backfilled lazily as answers are re-cached
+        _ensure_column(conn, "qa", "embedding", "BLOB")
+        _ensure_column(conn, "qa", "created_at", "REAL")
+        _ensure_column(conn, "qa", "question_key", "TEXT")
+        _ensure_column(conn, "qa", "tenant", "TEXT")
+        conn.execute("UPDATE qa SET tenant = ? WHERE tenant IS NULL", (DEFAULT_TENANT,))
+        _backfill_question_keys(conn)
+        _rebuild_qa_for_tenants(conn)
+        conn.execute("DROP INDEX IF EXISTS idx_qa_question_key")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_qa_tenant_question_key ON qa (tenant, question_key)")
+
+        # Content-addressed store of corpus chunk embeddings, keyed by hash(model + text)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS chunk_embeddings (
+                content_hash TEXT PRIMARY KEY,
+                model TEXT,
+                embedding BLOB,
+                created_at REAL
+            )
+        ''')
+
+        # Durable outbox for push notifications; rows stay until delivered or given up on
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message TEXT,
+                created_at REAL,
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at REAL DEFAULT 0,
+                status TEXT DEFAULT 'pending',
+                last_error TEXT
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON notification_outbox (status, next_attempt_at)")
+
+        # Persisted query embeddings, keyed by normalized question text and model
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                question_key TEXT,
+                model TEXT,
+                embedding BLOB,
+                last_used REAL,
+                PRIMARY KEY (question_key, model)
+            )
+        ''')
+
+        # Text extracted from documents, keyed by hash(extractor + file bytes); pages is a JSON list
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS extracted_text (
+                content_hash TEXT PRIMARY KEY,
+                pages TEXT,
+                created_at REAL
+            )
+        ''')
+
+        # Last seen (mtime, size) of each document, so unchanged files aren't re-hashed
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS document_files (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER,
+                size INTEGER,
+                content_hash TEXT
+            )
+        ''')
+
+        # Table for storing unknown questions
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS unknown_questions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        _ensure_column(conn, "unknown_questions", "tenant", "TEXT")
+        conn.execute("UPDATE unknown_questions SET tenant = ? WHERE tenant IS NULL", (DEFAULT_TENANT,))
 
 def get_session(session_id):
-    db_path = os.path.join(os.path.dirname(__file__), 'me', 'db.sqlite')
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("SELECT id, questions_asked FROM sessions WHERE session_id = ?", (session_id,))
-    row = c.fetchone()
-    conn.close()
+    row = db.connection().execute(
+        "SELECT id, questions_asked FROM sessions WHERE session_id = ?", (session_id,)
+    ).fetchone()
     return row
 
 def add_session(session_id):
-    db_path = os.path.join(os.path.dirname(__file__), 'me', 'db.sqlite')
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO sessions (session_id, questions_asked) VALUES (?, ?)", (session_id, 0))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        pass
-    conn.close()
-
-def save_unknown_question(question):
-    db_path = os.path.join(os.path.dirname(__file__), 'me', 'db.sqlite')
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("INSERT INTO unknown_questions (question) VALUES (?)", (question,))
-    conn.commit()
-    conn.close()
-
-def add_qa(question, answer):
-    db_path = os.path.join(os.path.dirname(__file__), 'me', 'db.sqlite')
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO qa (question, answer) VALUES (?, ?)", (question, answer))
-    except sqlite3.IntegrityError:
-        # Update if question already exists
-        c.execute("UPDATE qa SET answer = ? WHERE question = ?", (answer, question))
-    conn.commit()
-    conn.close()
-
-def get_answer(question):
-    db_path = os.path.join(os.path.dirname(__file__), 'me', 'db.sqlite')
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("SELECT answer FROM qa WHERE question = ?", (question,))
-    row = c.fetchone()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO sessions (session_id, questions_asked) VALUES (?, ?)", (session_id, 0))
+
+def save_unknown_question(question, tenant=DEFAULT_TENANT):
+    with transaction() as conn:
+        conn.execute("INSERT INTO unknown_questions (question, tenant) VALUES (?, ?)", (question, tenant))
+
+def add_qa(question, answer, embedding=None, tenant=DEFAULT_TENANT):
+    # embedding is the question vector as raw float32 bytes, used by the semantic cache
+    # Single upsert on the normalized key; an existing variant of the question is overwritten
+    with transaction() as conn:
+        conn.execute(
+            """
+            INSERT INTO qa (tenant, question, question_key, answer, embedding, created_at) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(tenant, question_key) DO UPDATE SET
+                answer = excluded.answer,
+                embedding = COALESCE(excluded.embedding, qa.embedding),
+                created_at = excluded.created_at
+            """,
+            (tenant, question, normalize_question(question), answer, embedding, time.time()),
+        )
+
+def load_qa_embeddings(since=None, limit=None, tenant=DEFAULT_TENANT):
+    # Newest first, so a size-capped cache keeps the most recent answers
+    query = "SELECT question, answer, embedding, created_at FROM qa WHERE embedding IS NOT NULL AND tenant = ?"
+    params = [tenant]
+    if since is not None:
+        query += " AND created_at >= ?"
+        params.append(since)
+    query += " ORDER BY created_at DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return db.connection().execute(query, params).fetchall()
+
+def get_answer(question, tenant=DEFAULT_TENANT):
+    row = db.connection().execute(
+        "SELECT answer FROM qa WHERE tenant = ? AND question_key = ?", (tenant, normalize_question(question))
+    ).fetchone()
     return row[0] if row else None
 
-def add_unknown_question(question):
-    db_path = os.path.join(os.path.dirname(__file__), 'me', 'db.sqlite')
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("INSERT INTO unknown_questions (question) VALUES (?)", (question,))
-    conn.commit()
-    conn.close()
+def add_unknown_question(question, tenant=DEFAULT_TENANT):
+    with transaction() as conn:
+        conn.execute("INSERT INTO unknown_questions (question, tenant) VALUES (?, ?)", (question, tenant))
 
 def increment_questions(session_id):
-    db_path = os.path.join(os.path.dirname(__file__), 'me', 'db.sqlite')
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("UPDATE sessions SET questions_asked = questions_asked + 1 WHERE session_id = ?", (session_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("UPDATE sessions SET questions_asked = questions_asked + 1 WHERE session_id = ?", (session_id,))
+
+def consume_question(session_id, max_questions):
+    # Create-or-increment in one statement: the conflict branch only bumps the
+    # counter while it's under the cap, so concurrent turns from one session
+    # can't both slip past max_questions. No row back means the quota is spent.
+    with transaction() as conn:
+        row = conn.execute(
+            """
+            INSERT INTO sessions (session_id, questions_asked) VALUES (?, 1)
+            ON CONFLICT(session_id) DO UPDATE SET questions_asked = questions_asked + 1
+            WHERE questions_asked < ?
+            RETURNING questions_asked
+            """,
+            (session_id, max_questions),
+        ).fetchone()
+    if row is None:
+        return None
+    return max(max_questions - row[0], 0)
+
+def get_chunk_embeddings(content_hashes):
+    # Returns {content_hash: float32 bytes} for the hashes that are stored
+    found = {}
+    hashes = list(content_hashes)
+    conn = db.connection()
+    # Stay well under SQLite's bound-parameter limit
+    for i in range(0, len(hashes), 500):
+        batch = hashes[i:i + 500]
+        placeholders = ",".join("?" * len(batch))
+        rows = conn.execute(
+            f"SELECT content_hash, embedding FROM chunk_embeddings WHERE content_hash IN ({placeholders})", batch
+        ).fetchall()
+        found.update(rows)
+    return found
+
+def put_chunk_embeddings(model, items):
+    # items: iterable of (content_hash, float32 bytes)
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO chunk_embeddings (content_hash, model, embedding, created_at) VALUES (?, ?, ?, ?)",
+            [(content_hash, model, blob, now) for content_hash, blob in items],
+        )
+
+def prune_chunk_embeddings(model, keep_hashes):
+    # Drops this model's stored chunks that are no longer part of the corpus
+    keep_hashes = set(keep_hashes)
+    with transaction() as conn:
+        stored = [row[0] for row in conn.execute("SELECT content_hash FROM chunk_embeddings WHERE model = ?", (model,))]
+        stale = [(content_hash,) for content_hash in stored if content_hash not in keep_hashes]
+        conn.executemany("DELETE FROM chunk_embeddings WHERE content_hash = ?", stale)
+    return len(stale)
+
+def get_file_hash(path, mtime_ns, size):
+    # The content hash recorded for path, if the file hasn't changed since
+    row = db.connection().execute(
+        "SELECT content_hash FROM document_files WHERE path = ? AND mtime_ns = ? AND size = ?", (path, mtime_ns, size)
+    ).fetchone()
+    return row[0] if row else None
+
+def put_file_hash(path, mtime_ns, size, content_hash):
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO document_files (path, mtime_ns, size, content_hash) VALUES (?, ?, ?, ?)",
+            (path, mtime_ns, size, content_hash),
+        )
+
+def get_extracted_pages(content_hash):
+    row = db.connection().execute("SELECT pages FROM extracted_text WHERE content_hash = ?", (content_hash,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def put_extracted_pages(content_hash, pages):
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO extracted_text (content_hash, pages, created_at) VALUES (?, ?, ?)",
+            (content_hash, json.dumps(pages), time.time()),
+        )
+
+def enqueue_notification(message):
+    with transaction() as conn:
+        return conn.execute(
+            "INSERT INTO notification_outbox (message, created_at) VALUES (?, ?)", (message, time.time())
+        ).lastrowid
+
+def due_notifications(limit, now=None):
+    # Oldest pending notifications whose retry delay has passed
+    now = time.time() if now is None else now
+    return db.connection().execute(
+        "SELECT id, message, attempts FROM notification_outbox "
+        "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+        (now, limit),
+    ).fetchall()
+
+def next_notification_due():
+    row = db.connection().execute(
+        "SELECT MIN(next_attempt_at) FROM notification_outbox WHERE status = 'pending'"
+    ).fetchone()
+    return row[0]
+
+def mark_notifications(ids, status, error=None, next_attempt_at=0):
+    # status: 'sent', 'failed' (given up) or 'pending' (retry at next_attempt_at)
+    with transaction() as conn:
+        conn.executemany(
+            "UPDATE notification_outbox SET status = ?, attempts = attempts + 1, last_error = ?, next_attempt_at = ? "
+            "WHERE id = ?",
+            [(status, error, next_attempt_at, notification_id) for notification_id in ids],
+        )
+
+def get_query_embedding(question_key, model):
+    row = db.connection().execute(
+        "SELECT embedding FROM query_embeddings WHERE question_key = ? AND model = ?", (question_key, model)
+    ).fetchone()
+    return row[0] if row else None
+
+def touch_query_embedding(question_key, model):
+    # Marks a row as used, so trimming keeps recently asked questions
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE query_embeddings SET last_used = ? WHERE question_key = ? AND model = ?",
+            (time.time(), question_key, model),
+        )
+
+def put_query_embedding(question_key, model, embedding, max_entries=None):
+    # embedding is raw float32 bytes; max_entries trims the least recently used rows
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO query_embeddings (question_key, model, embedding, last_used) VALUES (?, ?, ?, ?)",
+            (question_key, model, embedding, time.time()),
+        )
+        if max_entries is not None:
+            conn.execute(
+                "DELETE FROM query_embeddings WHERE rowid IN "
+                "(SELECT rowid FROM query_embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (max_entries,),
+            )
 
 init_db()
@@ -0,0 +1,246 @@
+import math
+import os
+import zlib
+
+import numpy as np
+from openai import AsyncOpenAI, OpenAI
+
+from database import prune_chunk_embeddings
+from lexical_index import tokenize
+from query_cache import query_cache
+from semantic_cache import SIMILARITY_THRESHOLD
+
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+# Provider used to build the index when EMBEDDING_PROVIDER isn't set
+DEFAULT_PROVIDER = "openai"
+HASHED_DIM = 2048
+# Character trigrams let "MintLang" partly match "mint"; they count less than whole words
+CHAR_NGRAM_WEIGHT = 0.5
+
+
+class EmbeddingProviderMismatch(ValueError):
+    pass
+
+
+class EmbeddingProvider:
+    """Turns chunk and question text into vectors.
+
+    The provider that builds the index must also embed the questions, so the
+    index metadata records spec() and provider_for_index() rebuilds the same
+    provider at serving time. The defaults here suit local providers, which are
+    cheap enough to call directly and never touch the network.
+    """
+
+    name = None
+    local = True
+    # Cosine similarity the semantic answer cache needs to treat two questions as one
+    similarity_threshold = SIMILARITY_THRESHOLD
+    # Cosine similarity below which a vector hit is treated as unrelated to the question;
+    # None keeps every hit, for providers whose scores don't separate the two
+    min_retrieval_score = None
+
+    @classmethod
+    def from_spec(cls, spec, **options):
+        raise NotImplementedError
+
+    def spec(self):
+        raise NotImplementedError
+
+    def fit(self, texts):
+        # Providers that learn from the corpus (e.g. IDF weights) do so at index build
+        return self
+
+    def embed_documents(self, texts):
+        raise NotImplementedError
+
+    def embed_corpus(self, texts, prune=True):
+        # Index build: returns (vectors in chunk order, report)
+        self.fit(texts)
+        vectors = self.embed_documents(texts)
+        return vectors, {"chunks": len(texts), "reused": 0, "embedded": len(texts), "dropped": 0}
+
+    def prune(self, texts):
+        # Drops cached vectors for chunks no longer in any index; returns how many
+        return 0
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+    def try_embed_query(self, text, offline=False):
+        # None means the question couldn't be embedded and retrieval should go lexical-only
+        return self.embed_query(text)
+
+    async def atry_embed_query(self, text, offline=False):
+        return self.try_embed_query(text, offline)
+
+
+class OpenAIProvider(EmbeddingProvider):
+    # The embeddings API; chunk vectors are cached by content hash and question vectors in query_cache
+
+    name = "openai"
+    local = False
+    min_retrieval_score = 0.25
+
+    def __init__(self, model=OPENAI_EMBEDDING_MODEL, client=None, async_client=None):
+        self.model = model
+        self._client = client
+        self._async_client = async_client
+
+    @classmethod
+    def from_spec(cls, spec, client=None, async_client=None, **options):
+        return cls(spec.get("model", OPENAI_EMBEDDING_MODEL), client=client, async_client=async_client)
+
+    def spec(self):
+        return {"name": self.name, "model": self.model}
+
+    @property
+    def client(self):
+        # Created on first use so building the provider doesn't require an API key
+        if self._client is None:
+            self._client = OpenAI()
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI()
+        return self._async_client
+
+    def embed_documents(self, texts):
+        from embeddings import create_embeddings
+        return np.asarray(create_embeddings(list(texts), client=self.client, model=self.model, progress=None), dtype=np.float32)
+
+    def embed_corpus(self, texts, prune=True):
+        from embeddings import embed_incremental
+        return embed_incremental(list(texts), model=self.model, client=self.client, prune=prune)
+
+    def prune(self, texts):
+        from embeddings import content_hash
+        return prune_chunk_embeddings(self.model, {content_hash(text, self.model) for text in texts})
+
+    def embed_query(self, text):
+        return query_cache.embed(self.client, text, self.model)
+
+    async def aembed_query(self, text):
+        return await query_cache.aembed(self.async_client, text, self.model)
+
+    def try_embed_query(self, text, offline=False):
+        return query_cache.try_embed(self.client, text, self.model, offline=offline)
+
+    async def atry_embed_query(self, text, offline=False):
+        return await query_cache.atry_embed(self.async_client, text, self.model, offline=offline)
+
+
+class HashedTfidfProvider(EmbeddingProvider):
+    """Offline CPU embeddings: TF-IDF over hashed word and character-trigram features.
+
+    Features are hashed into dim signed buckets (the hashing trick), so there is
+    no vocabulary to store. The only fitted state is the per-bucket IDF, learned
+    from the chunks at index build and kept in the index metadata. Embedding a
+    question takes well under a millisecond and makes no network calls.
+    """
+
+    name = "hashed-tfidf"
+    # Lexical vectors score paraphrases lower and different questions higher than
+    # semantic ones, so only near-identical questions share a cached answer
+    similarity_threshold = 0.97
+    # Relevant chunks often score ~0.05 and unrelated ones ~0.15, so no cutoff fits;
+    # fusion with BM25 ranks the hits instead
+    min_retrieval_score = None
+
+    def __init__(self, dim=HASHED_DIM, idf=None):
+        self.dim = dim
+        self.idf = np.ones(dim, dtype=np.float32) if idf is None else np.asarray(idf, dtype=np.float32)
+        if self.idf.shape != (dim,):
+            raise ValueError(f"Expected {dim} IDF weights, got {self.idf.shape}")
+
+    @classmethod
+    def from_spec(cls, spec, **options):
+        return cls(spec.get("dim", HASHED_DIM), spec.get("idf"))
+
+    def spec(self):
+        return {"name": self.name, "dim": self.dim, "idf": [round(float(value), 5) for value in self.idf]}
+
+    def _features(self, text):
+        # {bucket: signed, sublinear term weight} for one text
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+            padded = f"<{token}>"
+            for i in range(len(padded) - 2):
+                # "#" keeps trigrams apart from three-letter words
+                trigram = "#" + padded[i:i + 3]
+                counts[trigram] = counts.get(trigram, 0) + 1
+        buckets = {}
+        for feature, count in counts.items():
+            # crc32 rather than hash(): buckets must be the same in every process
+            h = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if h & 0x80000000 else -1.0
+            weight = (1 + math.log(count)) * (CHAR_NGRAM_WEIGHT if feature[0] == "#" else 1.0)
+            bucket = h % self.dim
+            buckets[bucket] = buckets.get(bucket, 0.0) + sign * weight
+        return buckets
+
+    def fit(self, texts):
+        document_frequency = np.zeros(self.dim, dtype=np.float32)
+        texts = list(texts)
+        for text in texts:
+            document_frequency[list(self._features(text))] += 1
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        return self
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for bucket, value in self._features(text).items():
+                vectors[row, bucket] = value
+        vectors *= self.idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+
+PROVIDERS = {provider.name: provider for provider in (OpenAIProvider, HashedTfidfProvider)}
+
+
+def get_provider(name=None, **options):
+    # The provider for a new index build: name, else $EMBEDDING_PROVIDER, else DEFAULT_PROVIDER
+    name = name or os.getenv("EMBEDDING_PROVIDER") or DEFAULT_PROVIDER
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown embedding provider {name!r}; choose one of {', '.join(PROVIDERS)}")
+    return PROVIDERS[name](**options)
+
+
+def index_provider_spec(meta):
+    # Indexes built before providers were recorded were all made with the OpenAI API
+    return meta.get("provider") or {"name": OpenAIProvider.name, "model": meta.get("model", OPENAI_EMBEDDING_MODEL)}
+
+
+def provider_for_index(meta, dim=None, requested=None, **options):
+    """Rebuilds the provider recorded in an index's metadata, for embedding questions.
+
+    Raises EmbeddingProviderMismatch when $EMBEDDING_PROVIDER (or requested) names
+    a different provider, or when the provider's vectors can't match the index's
+    dimension: questions embedded another way would be compared against vectors
+    they have nothing in common with. In-memory fallback indexes (see
+    embeddings.load_serving_index) always use their own provider.
+    """
+    spec = index_provider_spec(meta)
+    requested = requested or os.getenv("EMBEDDING_PROVIDER")
+    if requested and requested != spec["name"] and not meta.get("fallback"):
+        raise EmbeddingProviderMismatch(
+            f"The index was built with the {spec['name']!r} embedding provider but {requested!r} was requested. "
+            f"Rebuild it with EMBEDDING_PROVIDER={requested} python embeddings.py, or unset EMBEDDING_PROVIDER."
+        )
+    if spec["name"] not in PROVIDERS:
+        raise EmbeddingProviderMismatch(f"The index was built with unknown embedding provider {spec['name']!r}")
+    provider = PROVIDERS[spec["name"]].from_spec(spec, **options)
+    provider_dim = getattr(provider, "dim", None)
+    if dim is not None and provider_dim is not None and provider_dim != dim:
+        raise EmbeddingProviderMismatch(
+            f"The {spec['name']!r} provider produces {provider_dim}-dim vectors but the index has {dim}"
+        )
+    return provider
@@ -1,77 +1,257 @@
 import os
+import sys
+import hashlib
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from openai import OpenAI
-from pypdf import PdfReader
-import json
+from openai import OpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+import numpy as np
 
+# Before the project imports: their module-level settings read the environment
 load_dotenv()
 
-openai = OpenAI()
+from database import get_chunk_embeddings, put_chunk_embeddings, prune_chunk_embeddings
+from vector_store import VectorIndex, load_corpus, save_index
+from ann_index import ANN_MIN_ROWS, IVFIndex, ivf_path
+from lexical_index import BM25Index, bm25_path
+from embedding_providers import HashedTfidfProvider, get_provider
+from tenants import DEFAULT, load_tenants
+from chunking import MAX_CHUNK_TOKENS, OVERLAP_TOKENS, chunk_document
+from ingestion import load_pdf_text, load_pdf_texts
+from prompting import fetch_encoding
 
-def load_pdf_text(file_path):
-    reader = PdfReader(file_path)
-    text = ""
-    for page in reader.pages:
-        page_text = page.extract_text()
-        if page_text:
-            text += page_text + "\n"
-    return text.strip()  # strip whitespace
+EMBEDDING_MODEL = "text-embedding-3-small"
+# The embeddings endpoint accepts up to 2048 inputs per request
+BATCH_SIZE = 128
+MAX_WORKERS = 4
+MAX_RETRIES = 5
+
+# Errors worth retrying; anything else (bad input, auth) fails the build immediately
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+_client = None
+
+def get_client():
+    # Created on first use so importing this module doesn't require an API key
+    global _client
+    if _client is None:
+        _client = OpenAI()
+    return _client
 
 def load_text(file_path):
     with open(file_path, "r", encoding="utf-8") as f:
         return f.read().strip()
 
-def chunk_text(text, max_length=500):
-    chunks = []
+def tenant_sources(tenant):
+    # (path, loader) for each of a tenant's documents, in index order
+    return [
+        (path, load_pdf_text if path.lower().endswith(".pdf") else load_text)
+        for path in tenant.source_paths
+    ]
+
+# Documents that make up the default tenant's corpus
+SOURCES = tenant_sources(DEFAULT)
+
+def chunk_spans(text, max_length=500):
+    # Fixed-size chunker the index used before chunking.py; kept as the baseline for
+    # eval_chunkers.py. (start, end) offsets of each non-empty chunk, trimmed of
+    # surrounding whitespace
+    spans = []
     start = 0
     text_length = len(text)
     while start < text_length:
         end = min(start + max_length, text_length)
-        chunk = text[start:end].strip()
+        raw = text[start:end]
+        chunk = raw.strip()
         if chunk:  # only add non-empty chunks
-            chunks.append(chunk)
+            chunk_start = start + len(raw) - len(raw.lstrip())
+            spans.append((chunk_start, chunk_start + len(chunk)))
         start = end
-    return chunks
-
-def create_embeddings(text_chunks):
-    embeddings = []
-    for i, chunk in enumerate(text_chunks):
-        # Add print for debugging chunk length
-        print(f"Embedding chunk {i+1}/{len(text_chunks)} (length {len(chunk)})")
-        response = openai.embeddings.create(
-            model="text-embedding-3-small", input=chunk
-        )
-        embeddings.append(response.data[0].embedding)
-    return embeddings
-
-def main():
-    resume_text = load_pdf_text("me/MKM_Master_Resume.pdf")
-    summary_text = load_text("me/summary2.txt")
-    github_text = load_text("me/github_profile.txt")
-
-    combined_text = resume_text + "\n\n" + summary_text + "\n\n" + github_text
-    combined_text = combined_text.strip()
-
-    if not combined_text:
-        print("Error: Combined text is empty. Check input files.")
-        return
+    return spans
+
+def chunk_text(text, max_length=500):
+    return [text[start:end] for start, end in chunk_spans(text, max_length)]
+
+def load_documents(sources=SOURCES):
+    # PDFs are extracted in one pass so their pages can share a process pool
+    pdf_texts = load_pdf_texts([path for path, loader in sources if loader is load_pdf_text])
+    return [(path, pdf_texts[path] if path in pdf_texts else loader(path)) for path, loader in sources]
+
+def build_chunks(documents, max_tokens=MAX_CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    # Chunk each document separately so every chunk has one source and exact offsets into it
+    records = []
+    for source, text in documents:
+        for start, end, section in chunk_document(text, max_tokens, overlap_tokens):
+            records.append({
+                "id": len(records), "text": text[start:end], "source": source,
+                "section": section, "start": start, "end": end,
+            })
+    return records
+
+def print_progress(done, total):
+    print(f"Embedded {done}/{total} chunks")
+
+def _embed_batch(client, batch, model, max_retries):
+    for attempt in range(max_retries + 1):
+        try:
+            response = client.embeddings.create(model=model, input=batch)
+            # The API tags each vector with its input position; don't rely on response order
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except RETRYABLE_ERRORS:
+            if attempt == max_retries:
+                raise
+            # Exponential backoff with jitter so parallel workers don't retry in lockstep
+            time.sleep(min(2 ** attempt, 30) + random.uniform(0, 1))
+
+def create_embeddings(text_chunks, client=None, model=EMBEDDING_MODEL, batch_size=BATCH_SIZE,
+                      max_workers=MAX_WORKERS, max_retries=MAX_RETRIES, progress=print_progress):
+    # Sends batch_size chunks per request with up to max_workers requests in flight.
+    # The returned list lines up with text_chunks regardless of completion order.
+    client = client or get_client()
+    batches = [text_chunks[i:i + batch_size] for i in range(0, len(text_chunks), batch_size)]
+    results = [None] * len(batches)
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(_embed_batch, client, batch, model, max_retries): i
+            for i, batch in enumerate(batches)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            done += len(batches[i])
+            if progress:
+                progress(done, len(text_chunks))
+    return [embedding for batch in results for embedding in batch]
+
+def content_hash(text, model=EMBEDDING_MODEL):
+    # The model is part of the key so switching models never reuses old vectors
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+def embed_incremental(text_chunks, model=EMBEDDING_MODEL, client=None, prune=True, **kwargs):
+    # Only chunks whose (model, text) hash isn't already stored go to the API.
+    # Returns the vectors in chunk order plus a reused/embedded/dropped report.
+    hashes = [content_hash(chunk, model) for chunk in text_chunks]
+    stored = get_chunk_embeddings(set(hashes))
 
-    chunks = chunk_text(combined_text)
+    missing = {}
+    for chunk_hash, chunk in zip(hashes, text_chunks):
+        if chunk_hash not in stored and chunk_hash not in missing:
+            missing[chunk_hash] = chunk
+
+    if missing:
+        new_embeddings = create_embeddings(list(missing.values()), client=client, model=model, **kwargs)
+        new_items = [
+            (chunk_hash, np.asarray(embedding, dtype=np.float32).tobytes())
+            for chunk_hash, embedding in zip(missing, new_embeddings)
+        ]
+        put_chunk_embeddings(model, new_items)
+        stored.update(new_items)
+
+    dropped = prune_chunk_embeddings(model, hashes) if prune else 0
+    embeddings = [np.frombuffer(stored[chunk_hash], dtype=np.float32).tolist() for chunk_hash in hashes]
+    report = {
+        "chunks": len(text_chunks),
+        "reused": len(text_chunks) - sum(1 for h in hashes if h in missing),
+        "embedded": len(missing),
+        "dropped": dropped,
+    }
+    return embeddings, report
+
+def build_tenant(tenant, provider):
+    # Builds one tenant's index files; returns the chunk texts, or None if there was nothing to index
+    print(f"Building index for tenant {tenant.tenant_id} ({tenant.name})")
+    documents = [(source, text) for source, text in load_documents(tenant_sources(tenant)) if text]
+
+    if not documents:
+        print("Error: All documents are empty. Check input files.")
+        return None
+
+    chunks = build_chunks(documents)
     print(f"Total chunks created: {len(chunks)}")
 
     if len(chunks) == 0:
         print("Error: No chunks created from text.")
-        return
+        return None
 
-    embeddings = create_embeddings(chunks)
+    texts = [chunk["text"] for chunk in chunks]
+    # Stale cached chunks are pruned by main() once every tenant has been built
+    embeddings, report = provider.embed_corpus(texts, prune=False)
+    print(f"Embedded with {provider.name}. Reused {report['reused']} chunks, embedded {report['embedded']}")
 
     if len(chunks) != len(embeddings):
         print(f"Warning: Chunks count ({len(chunks)}) != Embeddings count ({len(embeddings)})")
 
-    with open("me/embeddings.json", "w", encoding="utf-8") as f:
-        json.dump(embeddings, f)
+    index_path = tenant.index_path
+    index = save_index(embeddings, chunks=chunks, path=index_path, provider=provider.spec(), tenant=tenant.tenant_id)
+    # Keyword index over the same chunks, for hybrid and offline retrieval
+    BM25Index.build(index.texts).save(bm25_path(index_path))
+
+    # Large corpora also get an approximate index; small ones are searched exactly
+    if len(index) >= ANN_MIN_ROWS:
+        IVFIndex.build(index.vectors).save(ivf_path(index_path))
+        print(f"Built IVF index at {ivf_path(index_path)}")
+
+    print(f"Created and saved {len(embeddings)} embeddings to {index_path}.")
+    return texts
+
+def build_fallback_index(tenant):
+    # In-memory index of the tenant's documents with the offline provider, for serving
+    # when no built index with chunk text exists. Nothing is written to disk
+    sources = [(path, loader) for path, loader in tenant_sources(tenant) if os.path.exists(path)]
+    documents = [(source, text) for source, text in load_documents(sources) if text]
+    chunks = build_chunks(documents)
+    provider = HashedTfidfProvider()
+    vectors, _ = provider.embed_corpus([chunk["text"] for chunk in chunks])
+    return VectorIndex(vectors, chunks, {"provider": provider.spec(), "tenant": tenant.tenant_id, "fallback": True})
+
+def load_serving_index(tenant):
+    """The tenant's index for the chat apps.
+
+    Falls back to build_fallback_index() when the index is missing or has no
+    searchable chunk text (e.g. converted from the legacy embeddings.json), so a
+    fresh checkout answers from its documents before embeddings.py has been run.
+    """
+    try:
+        index = load_corpus(tenant.index_path)
+        if any(text is not None for text in index.texts):
+            return index
+    except FileNotFoundError:
+        pass
+    print(f"Serving tenant {tenant.tenant_id} from an offline index of its documents; "
+          f"run `python embeddings.py {tenant.tenant_id}` to build the real one.", flush=True)
+    return build_fallback_index(tenant)
+
+def main(tenant_ids=None):
+    # Builds the given tenants, or all of them
+    tenants = load_tenants()
+    tenant_ids = tenant_ids or list(tenants)
+    unknown = [tenant_id for tenant_id in tenant_ids if tenant_id not in tenants]
+    if unknown:
+        print(f"Error: unknown tenant(s) {', '.join(unknown)}; configured: {', '.join(tenants)}")
+        return
+
+    # The apps only read the tokenizer from disk; fetch it while the build has network access
+    try:
+        fetch_encoding()
+    except Exception as e:
+        print(f"Warning: couldn't cache the tokenizer ({e}); the apps will estimate token counts")
+
+    # EMBEDDING_PROVIDER picks the backend (OpenAI by default); each index records it
+    all_texts = []
+    built = True
+    for tenant_id in tenant_ids:
+        provider = get_provider()
+        texts = build_tenant(tenants[tenant_id], provider)
+        built = built and texts is not None
+        all_texts.extend(texts or [])
 
-    print(f"Created and saved {len(embeddings)} embeddings.")
+    # Cached chunk embeddings are shared by every tenant, so they can only be pruned
+    # after a complete build
+    if built and set(tenant_ids) == set(tenants):
+        dropped = get_provider().prune(all_texts)
+        print(f"Dropped {dropped} stale cached chunk embeddings")
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1:])
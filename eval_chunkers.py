@@ -0,0 +1,129 @@
+"""Compares the fixed-size and structure-aware chunkers on retrieval quality.
+
+Each question in EVAL_SET has a fact that answers it. A question is a hit at k
+when one of the top k chunks contains the whole fact, so a chunker that cuts
+the fact in half scores a miss even if both halves are retrieved. Alongside
+hit@k the script reports the prompt tokens spent on the top k chunks, and the
+tokens needed to reach the first chunk that holds the fact (averaged over the
+questions whose fact survived chunking).
+
+By default chunks and questions are embedded with the offline hashed TF-IDF
+provider fitted on each chunker's output, so the comparison costs nothing.
+--provider openai uses the embedding API instead (chunk vectors go through the
+same cache as the index build).
+
+    python eval_chunkers.py [--provider openai] [--top-k 3]
+"""
+import argparse
+
+import numpy as np
+
+from chunking import MAX_CHUNK_TOKENS, OVERLAP_TOKENS
+from embedding_providers import PROVIDERS, HashedTfidfProvider, get_provider
+from embeddings import build_chunks, chunk_spans, load_documents
+from prompting import count_tokens
+from retrieval import RetrievalEngine
+
+# (question, fact from the corpus that answers it)
+EVAL_SET = [
+    ("How much did you reduce booking latency?", "Reduced booking latency by 40%"),
+    ("What availability did the microservices migration achieve?", "Increased system availability to 99.95%"),
+    ("Which message brokers did you use for asynchronous workflows?", "asynchronous workflows using RabbitMQ & Kafka"),
+    ("How did you make messaging fault tolerant?", "RabbitMQ DLQs, retry strategies, and acknowledgments"),
+    ("What did you use for service discovery and routing?", "Spring Cloud (Eureka, Config Server, Gateway)"),
+    ("How did third-party integrations help the hotel?", "food order sync with the hotel kitchen, boosting ancillary revenue streams by 25%"),
+    ("Where are you doing your master's degree?", "MS in Computer Software Engineering, Arizona State University"),
+    ("What is your undergraduate degree?", "BE in Electronics and Communication, Bangalore Institute of Technology"),
+    ("When can you start a full-time role?", "seeking full-time SWE roles in the U.S. starting May 2026"),
+    ("What did you work on at Appzera?", "Engineered critical backend enhancements for healthcare systems"),
+    ("How does the MintLang interpreter execute programs?", "built the interpreter (MintEvaluator) using the visitor pattern"),
+    ("What messaging modes does your TCP chat application support?", "unicast (one-to-one) and broadcast (one-to-many) messaging"),
+    ("Which databases have you worked with?", "Spring Data JPA, PostgreSQL, MySQL, Redis"),
+    ("What leadership roles have you held?", "Elected Co-President of ASU's Product Management Club"),
+    ("What do you do when you're not coding?", "you'll usually find me on the tennis court"),
+    ("Where can I find your code on GitHub?", "https://github.com/monisha-krishnamurthy"),
+]
+
+def normalize(text):
+    return " ".join(text.split()).casefold()
+
+
+def fixed_size_chunks(documents, max_length=500):
+    records = []
+    for source, text in documents:
+        for start, end in chunk_spans(text, max_length):
+            records.append({
+                "id": len(records), "text": text[start:end], "source": source,
+                "section": None, "start": start, "end": end,
+            })
+    return records
+
+
+def evaluate(chunks, embed, top_k):
+    texts = [chunk["text"] for chunk in chunks]
+    tokens = [count_tokens(text) for text in texts]
+    engine = RetrievalEngine(embed(texts), texts)
+    query_vectors = embed([question for question, _ in EVAL_SET])
+
+    hits = {k: 0 for k in range(1, top_k + 1)}
+    context_tokens, tokens_to_hit, misses = [], [], []
+    for (question, fact), query in zip(EVAL_SET, query_vectors):
+        ranked = [row for row, _ in engine.search_ids(query, top_k=len(chunks))]
+        context_tokens.append(sum(tokens[row] for row in ranked[:top_k]))
+        fact = normalize(fact)
+        rank = next((i for i, row in enumerate(ranked) if fact in normalize(texts[row])), None)
+        if rank is None:
+            # No chunk holds the whole fact: the chunker split it
+            misses.append(question)
+            continue
+        tokens_to_hit.append(sum(tokens[row] for row in ranked[:rank + 1]))
+        for k in hits:
+            if rank < k:
+                hits[k] += 1
+
+    return {
+        "chunks": len(chunks),
+        "mean_chunk_tokens": sum(tokens) / len(tokens),
+        "hit_rate": {k: count / len(EVAL_SET) for k, count in hits.items()},
+        "context_tokens": sum(context_tokens) / len(context_tokens),
+        "tokens_to_hit": sum(tokens_to_hit) / len(tokens_to_hit) if tokens_to_hit else None,
+        "unanswerable": misses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--provider", choices=list(PROVIDERS), default=HashedTfidfProvider.name,
+                        help="embedding provider for chunks and questions")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--max-tokens", type=int, default=MAX_CHUNK_TOKENS)
+    parser.add_argument("--overlap-tokens", type=int, default=OVERLAP_TOKENS)
+    args = parser.parse_args()
+
+    documents = [(source, text) for source, text in load_documents() if text]
+    chunkers = {
+        "fixed-500-chars": fixed_size_chunks(documents),
+        "structure-aware": build_chunks(documents, args.max_tokens, args.overlap_tokens),
+    }
+
+    for name, chunks in chunkers.items():
+        provider = get_provider(args.provider)
+        if provider.local:
+            # Fitted on this chunker's chunks only, as an index build would be
+            embed = provider.fit([chunk["text"] for chunk in chunks]).embed_documents
+        else:
+            # Cached like an index build, without pruning the index's stored chunks
+            embed = lambda texts: np.asarray(provider.embed_corpus(texts, prune=False)[0], dtype=np.float32)
+        result = evaluate(chunks, embed, args.top_k)
+        hit_rates = "  ".join(f"hit@{k}={rate:.2f}" for k, rate in result["hit_rate"].items())
+        tokens_to_hit = "n/a" if result["tokens_to_hit"] is None else f"{result['tokens_to_hit']:.0f}"
+        answerable = len(EVAL_SET) - len(result["unanswerable"])
+        print(f"{name:<16} {result['chunks']:>3} chunks (~{result['mean_chunk_tokens']:.0f} tokens)  {hit_rates}  "
+              f"context@{args.top_k}={result['context_tokens']:.0f} tokens  "
+              f"tokens-to-hit={tokens_to_hit} ({answerable}/{len(EVAL_SET)} answerable)")
+        for question in result["unanswerable"]:
+            print(f"    split fact: {question}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import openai
+
+from background import BackgroundWriter
+from prompting import CHAT_MODEL, count_tokens
+
+# Tokens allowed for earlier turns (rolling summary + verbatim turns) on each request
+HISTORY_TOKEN_BUDGET = 1200
+# Most recent turns sent word for word; older ones are folded into the summary
+KEEP_TURNS = 4
+SUMMARY_MAX_TOKENS = 200
+SUMMARY_TIMEOUT = 15.0
+# Sessions whose summaries are kept in memory; the least recently used are forgotten
+MAX_SESSIONS = 1024
+# Per-message overhead the chat format adds on top of the content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# One worker thread for every compactor: tenants come and go, the thread doesn't
+summarizer = BackgroundWriter(name="history-summarizer")
+
+SUMMARY_PROMPT = """You maintain a running summary of a chat between a visitor and {name}.
+Merge the new exchanges into the summary so far. Keep what later answers may depend on:
+the visitor's name, email, company and role, what they asked about, and anything {name}
+offered or promised. Drop small talk. Write plain prose, at most 120 words."""
+
+
+def message_tokens(message):
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def split_turns(history):
+    """Groups history into turns, each a user message and the replies that follow it.
+
+    Tool results and tool-call requests only mattered to the turn that made them,
+    so they are dropped here; the remaining messages are reduced to role and
+    content (chat UIs add fields of their own). Returns (turns, tool messages dropped).
+    """
+    turns = []
+    dropped = 0
+    for message in history or []:
+        role = message.get("role")
+        if role == "tool" or (role == "assistant" and message.get("tool_calls") and not message.get("content")):
+            dropped += 1
+            continue
+        if role not in ("user", "assistant") or not message.get("content"):
+            continue
+        if role == "user" or not turns:
+            turns.append([])
+        turns[-1].append({"role": role, "content": message["content"]})
+    return turns, dropped
+
+
+def turns_digest(turns):
+    # Identifies the turns a summary covers, so a cleared or edited chat isn't
+    # summarized with another conversation's state
+    digest = hashlib.sha256()
+    for turn in turns:
+        for message in turn:
+            digest.update(f"{message['role']}\0{message['content']}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def transcript(turns, name):
+    speakers = {"user": "Visitor", "assistant": name}
+    return "\n".join(f"{speakers[message['role']]}: {message['content']}" for turn in turns for message in turn)
+
+
+class HistoryCompactor:
+    """Keeps the conversation sent with each request under a token budget.
+
+    The last keep_turns turns go out verbatim. Older turns are folded into a
+    rolling summary, one model call per batch of turns that age out: refresh()
+    runs after each reply, on the shared summarizer thread, and only summarizes the
+    turns added since the previous summary. compact() never calls the API; turns
+    that have aged out but aren't summarized yet are sent verbatim while they fit
+    the budget and dropped (oldest first) when they don't.
+    """
+
+    def __init__(self, client, name, budget=HISTORY_TOKEN_BUDGET, keep_turns=KEEP_TURNS, max_sessions=MAX_SESSIONS):
+        self.client = client
+        self.name = name
+        self.budget = budget
+        self.keep_turns = keep_turns
+        self.max_sessions = max_sessions
+        self._summaries = OrderedDict()  # session_id -> (turns folded, digest of those turns, summary)
+        self._lock = threading.Lock()
+
+    def _summary(self, session_id, turns):
+        # (turns folded, summary) for this session, or (0, "") when the cached
+        # summary doesn't describe the start of this history
+        with self._lock:
+            entry = self._summaries.get(session_id)
+            if entry is None:
+                return 0, ""
+            self._summaries.move_to_end(session_id)
+        folded, digest, summary = entry
+        if folded > len(turns) or turns_digest(turns[:folded]) != digest:
+            return 0, ""
+        return folded, summary
+
+    def compact(self, session_id, history):
+        """Returns (messages to send in place of history, stats)."""
+        turns, tool_dropped = split_turns(history)
+        folded, summary = self._summary(session_id, turns) if session_id else (0, "")
+        pending = turns[folded:]
+
+        summary_message = None
+        remaining = self.budget
+        if summary:
+            summary_message = {"role": "system", "content": f"Summary of the conversation so far:\n{summary}"}
+            remaining -= message_tokens(summary_message)
+
+        # Newest first; the latest turn is always kept so a follow-up has its antecedent
+        kept = []
+        dropped = 0
+        for turn in reversed(pending):
+            tokens = sum(message_tokens(message) for message in turn)
+            if kept and tokens > remaining:
+                dropped = len(pending) - len(kept)
+                break
+            kept.append(turn)
+            remaining -= tokens
+        kept.reverse()
+
+        messages = ([summary_message] if summary_message else []) + [message for turn in kept for message in turn]
+        stats = {
+            "history_tokens": sum(message_tokens(message) for message in messages),
+            "turns_verbatim": len(kept),
+            "turns_summarized": folded,
+            "turns_dropped": dropped,
+            "tool_messages_dropped": tool_dropped,
+        }
+        return messages, stats
+
+    def summarize(self, summary, turns):
+        response = self.client.with_options(timeout=SUMMARY_TIMEOUT).chat.completions.create(
+            model=CHAT_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT.format(name=self.name)},
+                {"role": "user", "content": f"Summary so far:\n{summary or '(none)'}\n\nNew exchanges:\n{transcript(turns, self.name)}"},
+            ],
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=0,
+        )
+        return (response.choices[0].message.content or "").strip()
+
+    def refresh(self, session_id, history):
+        # Folds every turn older than the last keep_turns into the session's summary
+        if not session_id:
+            return
+        turns, _ = split_turns(history)
+        fold_until = len(turns) - self.keep_turns
+        folded, summary = self._summary(session_id, turns)
+        if fold_until <= folded:
+            return
+        try:
+            summary = self.summarize(summary, turns[folded:fold_until])
+        except openai.APIError as e:
+            # The turns stay unsummarized and compact() keeps sending what fits
+            print(f"History summary failed for session {session_id[:8]}: {e}", flush=True)
+            return
+        with self._lock:
+            self._summaries[session_id] = (fold_until, turns_digest(turns[:fold_until]), summary)
+            self._summaries.move_to_end(session_id)
+            while len(self._summaries) > self.max_sessions:
+                self._summaries.popitem(last=False)
+
+    def submit_refresh(self, session_id, history):
+        # Summaries are made off the request path and used from the next turn on
+        summarizer.submit(self.refresh, session_id, list(history or []))
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pypdf
+from pypdf import PdfReader
+
+from database import get_extracted_pages, get_file_hash, put_extracted_pages, put_file_hash
+
+# Part of the text cache key: another pypdf release may extract text differently
+EXTRACTOR = f"pypdf-{pypdf.__version__}"
+# Below this many uncached pages, starting worker processes costs more than it saves
+PARALLEL_MIN_PAGES = 8
+PAGES_PER_TASK = 4
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_key(path):
+    # Key of path's extracted text. The file is only re-hashed when its mtime or size
+    # changes; a file that was touched but not edited still hits the cache
+    stat = os.stat(path)
+    digest = get_file_hash(path, stat.st_mtime_ns, stat.st_size)
+    if digest is None:
+        digest = file_digest(path)
+        put_file_hash(path, stat.st_mtime_ns, stat.st_size, digest)
+    return hashlib.sha256(f"{EXTRACTOR}\0{digest}".encode("utf-8")).hexdigest()
+
+
+def _extract_range(path, start, stop):
+    # Runs in a worker process; each task opens its own reader
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _iter_serial(path):
+    reader = PdfReader(path)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def iter_pages(paths, max_workers=MAX_WORKERS):
+    """Yields (path, page_number, text) for every page of the given PDFs, in order.
+
+    Pages come from the extracted-text cache when the file is unchanged. Otherwise,
+    once there are at least PARALLEL_MIN_PAGES pages to extract, every uncached
+    document is split into page ranges that a process pool works through ahead of
+    the consumer, so later documents are extracted while earlier ones stream out.
+    A document's text is cached once all its pages have been read.
+    """
+    plans = []
+    for path in paths:
+        key = text_key(path)
+        pages = get_extracted_pages(key)
+        page_count = len(pages) if pages is not None else len(PdfReader(path).pages)
+        plans.append((path, key, pages, page_count))
+
+    uncached = sum(page_count for _, _, pages, page_count in plans if pages is None)
+    pool = None
+    if uncached >= PARALLEL_MIN_PAGES and max_workers > 1:
+        pool = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        # Submit every range up front; results are still consumed in document order
+        tasks = {}
+        if pool is not None:
+            for path, key, pages, page_count in plans:
+                if pages is None:
+                    tasks[path] = [
+                        pool.submit(_extract_range, path, start, min(start + PAGES_PER_TASK, page_count))
+                        for start in range(0, page_count, PAGES_PER_TASK)
+                    ]
+
+        for path, key, pages, page_count in plans:
+            if pages is not None:
+                for page_number, text in enumerate(pages):
+                    yield path, page_number, text
+                continue
+            if path in tasks:
+                extracted = (text for future in tasks[path] for text in future.result())
+            else:
+                extracted = _iter_serial(path)
+            pages = []
+            for text in extracted:
+                yield path, len(pages), text
+                pages.append(text)
+            put_extracted_pages(key, pages)
+    finally:
+        if pool is not None:
+            # A consumer that stops early doesn't wait for pages it will never read
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def join_pages(pages):
+    return "\n".join(text for text in pages if text).strip()
+
+
+def load_pdf_texts(paths, max_workers=MAX_WORKERS):
+    # {path: full text} for several PDFs, extracted together
+    pages = {path: [] for path in paths}
+    for path, _, text in iter_pages(paths, max_workers):
+        pages[path].append(text)
+    return {path: join_pages(texts) for path, texts in pages.items()}
+
+
+def load_pdf_text(file_path):
+    return load_pdf_texts([file_path])[file_path]
+
+
+if __name__ == "__main__":
+    # Extract the given PDFs, reporting how long each pass takes (the second should be cached)
+    paths = sys.argv[1:] or ["me/MKM_Master_Resume.pdf"]
+    for attempt in ("first", "second"):
+        started = time.perf_counter()
+        count = sum(1 for _ in iter_pages(paths))
+        print(f"{attempt} pass: {count} pages from {len(paths)} file(s) in {(time.perf_counter() - started) * 1000:.1f} ms")
@@ -0,0 +1,130 @@
+import json
+import math
+import os
+import re
+
+import numpy as np
+
+# Okapi BM25 parameters: k1 caps how much repeated terms count, b how much long chunks are penalized
+K1 = 1.5
+B = 0.75
+
+TOKEN_RE = re.compile(r"\w+")
+# Question words and function words match nearly every chunk, so "What did you do at
+# Appzera?" would otherwise rank chunks by how often they say "you" and "do"
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be been but by can could did do does doing for from
+had has have how i if in into is it its just me my of on or our s so t that the their them then
+there these they this to was we were what when where which who why will with would you your
+""".split())
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall((text or "").casefold()) if token not in STOPWORDS]
+
+
+def bm25_path(index_path):
+    return os.path.splitext(index_path)[0] + ".bm25.json"
+
+
+class BM25Index:
+    """In-memory inverted index scoring chunks with Okapi BM25.
+
+    Each posting list holds the rows containing a term and that term's BM25
+    weight in each row, computed once at build time, so a query is a handful
+    of scatter-adds into a score vector. Exact tokens like "MintLang" or a
+    company name score highly here even when dense search ranks them low.
+    """
+
+    def __init__(self, postings, doc_lengths, k1=K1, b=B):
+        # postings: {term: (rows, term frequencies)}
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.term_frequencies = postings
+        n_docs = len(self.doc_lengths)
+        average_length = float(self.doc_lengths.mean()) if n_docs and self.doc_lengths.any() else 1.0
+        self.postings = {}
+        for term, (rows, tfs) in postings.items():
+            rows = np.asarray(rows, dtype=np.int32)
+            tfs = np.asarray(tfs, dtype=np.float32)
+            idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            norms = k1 * (1 - b + b * self.doc_lengths[rows] / average_length)
+            self.postings[term] = (rows, idf * tfs * (k1 + 1) / (tfs + norms))
+
+    @classmethod
+    def build(cls, texts, k1=K1, b=B):
+        # Rows without text (legacy placeholders) get no postings and never match
+        postings = {}
+        doc_lengths = []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for term, count in counts.items():
+                rows, tfs = postings.setdefault(term, ([], []))
+                rows.append(row)
+                tfs.append(count)
+        return cls(postings, doc_lengths, k1, b)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def scores(self, query):
+        # BM25 score of every row; None when no query term is in the index
+        scores = None
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            if scores is None:
+                scores = np.zeros(len(self), dtype=np.float32)
+            rows, weights = posting
+            scores[rows] += weights
+        return scores
+
+    def search_ids(self, query, top_k=3):
+        # [(row, score), ...] best first, only rows matching at least one term
+        scores = self.scores(query)
+        if scores is None:
+            return []
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        ranked = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(row), float(scores[row])) for row in ranked]
+
+    def save(self, path):
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_lengths": self.doc_lengths.astype(int).tolist(),
+            "postings": {term: [list(map(int, rows)), list(map(int, tfs))] for term, (rows, tfs) in self.term_frequencies.items()},
+        }
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["postings"], data["doc_lengths"], data["k1"], data["b"])
+
+
+def load_bm25(index_path, texts):
+    # The index persisted by embeddings.py when it matches the corpus; otherwise (legacy
+    # or hand-built indexes) it is rebuilt from the chunk texts, which is fast
+    path = bm25_path(index_path) if index_path else None
+    if path and os.path.exists(path):
+        try:
+            index = BM25Index.load(path)
+            if len(index) == len(texts):
+                return index
+            print(f"Ignoring {path}: built for {len(index)} chunks, the index has {len(texts)}", flush=True)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable {path}: {e}", flush=True)
+    return BM25Index.build(texts)
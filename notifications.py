@@ -0,0 +1,155 @@
+import os
+import queue
+import random
+import threading
+import time
+
+import requests
+
+from database import due_notifications, enqueue_notification, mark_notifications, next_notification_due
+
+PUSHOVER_URL = "https://api.pushover.net/1/messages.json"
+# Pushover rejects messages longer than this
+MAX_MESSAGE_LENGTH = 1024
+REQUEST_TIMEOUT = 5
+# Bursts arriving within this window go out as a single push
+COALESCE_SECONDS = 1.0
+MAX_BATCH = 20
+MAX_ATTEMPTS = 6
+MAX_BACKOFF_SECONDS = 300
+MAX_PENDING_WAKEUPS = 100
+
+
+class NotificationDispatcher:
+    """Delivers push notifications from a durable SQLite outbox on a worker thread.
+
+    notify() records the message in the outbox and returns immediately; the worker
+    waits COALESCE_SECONDS for more to arrive, joins what's due into one Pushover
+    message, and retries failures with exponential backoff. Anything still pending
+    when the process stops is sent after the next start.
+    """
+
+    def __init__(self, token=None, user=None, url=None, timeout=REQUEST_TIMEOUT,
+                 coalesce_seconds=COALESCE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.token = token
+        self.user = user
+        self.url = url or os.getenv("PUSHOVER_URL", PUSHOVER_URL)
+        self.timeout = timeout
+        self.coalesce_seconds = coalesce_seconds
+        self.max_attempts = max_attempts
+        # Only a wake-up signal goes through the queue; the outbox holds the messages,
+        # so a full queue never loses a notification
+        self._wakeups = queue.Queue(maxsize=MAX_PENDING_WAKEUPS)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    @property
+    def configured(self):
+        return bool(self.token and self.user)
+
+    def start(self):
+        with self._lock:
+            if self.configured and (self._thread is None or not self._thread.is_alive()):
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def notify(self, message):
+        if not self.configured:
+            return None
+        notification_id = enqueue_notification(message)
+        self.start()
+        self._wake()
+        return notification_id
+
+    def _wake(self):
+        try:
+            self._wakeups.put_nowait(True)
+        except queue.Full:
+            pass  # The worker is already due to drain the outbox
+
+    def _wait_for_work(self):
+        # Sleep until woken or until the earliest pending retry is due
+        due = next_notification_due()
+        timeout = None if due is None else max(due - time.time(), 0)
+        try:
+            self._wakeups.get(timeout=timeout)
+        except queue.Empty:
+            return
+        # Coalesce the rest of the burst, then drop the extra wake-ups it caused
+        self._stopping.wait(self.coalesce_seconds)
+        while True:
+            try:
+                self._wakeups.get_nowait()
+            except queue.Empty:
+                break
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wait_for_work()
+            self.drain()
+
+    def drain(self):
+        # Sends everything currently due; returns the number of notifications delivered
+        delivered = 0
+        while True:
+            batch = due_notifications(MAX_BATCH)
+            if not batch:
+                return delivered
+            if not self._send_batch(batch):
+                return delivered
+            delivered += len(batch)
+
+    def _send_batch(self, batch):
+        # Take as many whole messages as fit in one push; the rest go in the next one
+        fitted, length = [], 0
+        for row in batch:
+            extra = len(row[1]) + (1 if fitted else 0)
+            if fitted and length + extra > MAX_MESSAGE_LENGTH:
+                break
+            fitted.append(row)
+            length += extra
+        batch = fitted
+        ids = [row[0] for row in batch]
+        message = "\n".join(row[1] for row in batch)
+        if len(message) > MAX_MESSAGE_LENGTH:
+            message = message[:MAX_MESSAGE_LENGTH - 3] + "..."
+        try:
+            response = requests.post(
+                self.url,
+                data={"token": self.token, "user": self.user, "message": message},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            self._retry_later(batch, str(e))
+            return False
+        if response.status_code < 300:
+            mark_notifications(ids, "sent")
+            return True
+        error = f"HTTP {response.status_code}"
+        if response.status_code == 429 or response.status_code >= 500:
+            self._retry_later(batch, error)
+        else:
+            # Other 4xx (bad token, bad user) won't succeed on retry
+            print(f"Dropping {len(ids)} notification(s): {error}", flush=True)
+            mark_notifications(ids, "failed", error)
+        return False
+
+    def _retry_later(self, batch, error):
+        print(f"Notification delivery failed, will retry: {error}", flush=True)
+        exhausted = [row[0] for row in batch if row[2] + 1 >= self.max_attempts]
+        retry = [row[0] for row in batch if row[2] + 1 < self.max_attempts]
+        if exhausted:
+            mark_notifications(exhausted, "failed", error)
+        if retry:
+            # The batch retries together, backing off by its most-retried message
+            attempts = max(row[2] for row in batch)
+            delay = min(2 ** attempts, MAX_BACKOFF_SECONDS) + random.uniform(0, 1)
+            mark_notifications(retry, "pending", error, time.time() + delay)
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import re
+
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to a character estimate
+    tiktoken = None
+
+# Tokens allowed for the whole system prompt (persona prefix + retrieved context)
+PROMPT_TOKEN_BUDGET = 2000
+CHAT_MODEL = "gpt-4o-mini"
+
+# BPE files are only ever read from here. tiktoken would otherwise download the file
+# on first use (with no timeout) from inside the request path; `python prompting.py`
+# fetches it ahead of time, e.g. while building the deployment
+TIKTOKEN_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".tiktoken")
+ENCODING_URL = "https://openaipublic.blob.core.windows.net/encodings/{name}.tiktoken"
+
+_encoding = None
+
+
+def encoding_cache_path(name):
+    # Where tiktoken's read_file_cached keeps the BPE file for the given encoding
+    return os.path.join(TIKTOKEN_CACHE_DIR, hashlib.sha1(ENCODING_URL.format(name=name).encode()).hexdigest())
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        _encoding = False
+        if tiktoken is not None:
+            name = tiktoken.encoding_name_for_model(CHAT_MODEL)
+            if os.path.exists(encoding_cache_path(name)):
+                os.environ["TIKTOKEN_CACHE_DIR"] = TIKTOKEN_CACHE_DIR
+                try:
+                    _encoding = tiktoken.get_encoding(name)
+                except Exception as e:
+                    print(f"Estimating token counts: couldn't load {name} from {TIKTOKEN_CACHE_DIR}: {e}", flush=True)
+    return _encoding or None
+
+
+def using_token_estimate():
+    # True when counts are the character estimate rather than the model's tokenizer
+    return _get_encoding() is None
+
+
+def fetch_encoding():
+    # Downloads the chat model's BPE file into TIKTOKEN_CACHE_DIR; needs network access
+    global _encoding
+    os.environ["TIKTOKEN_CACHE_DIR"] = TIKTOKEN_CACHE_DIR
+    name = tiktoken.encoding_name_for_model(CHAT_MODEL)
+    tiktoken.get_encoding(name)
+    _encoding = None
+    return encoding_cache_path(name)
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        # ~4 characters per token for English text
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def split_excerpts(text):
+    # Paragraph-sized pieces of a document, used to top up the prompt after retrieval
+    return [part.strip() for part in re.split(r"\n\s*\n", text or "") if part.strip()]
+
+
+class PromptBuilder:
+    """Assembles a system prompt under a fixed token budget.
+
+    The persona instructions come first and are always included. At around 340
+    tokens they are below the API's 1024-token minimum for prompt caching, so
+    every request pays for them in full. The remaining budget is filled in
+    priority order: retrieved chunks (best first), then summary excerpts that the
+    chunks don't already contain. Anything that doesn't fit is left out.
+    """
+
+    def __init__(self, prefix, summary="", budget=PROMPT_TOKEN_BUDGET):
+        self.prefix = prefix.rstrip()
+        self.prefix_tokens = count_tokens(self.prefix)
+        self.excerpts = [(excerpt, count_tokens(excerpt)) for excerpt in split_excerpts(summary)]
+        self.budget = budget
+
+    def build(self, chunks=(), closing=""):
+        remaining = self.budget - self.prefix_tokens - count_tokens(closing)
+        stats = {"prefix_tokens": self.prefix_tokens, "chunks_used": 0, "excerpts_used": 0, "dropped": 0}
+
+        selected_chunks = []
+        for chunk in chunks:
+            tokens = count_tokens(chunk)
+            if tokens <= remaining:
+                selected_chunks.append(chunk)
+                remaining -= tokens
+            else:
+                stats["dropped"] += 1
+        selected_excerpts = []
+        for excerpt, tokens in self.excerpts:
+            if any(excerpt in chunk for chunk in selected_chunks):
+                continue
+            if tokens <= remaining:
+                selected_excerpts.append(excerpt)
+                remaining -= tokens
+            else:
+                stats["dropped"] += 1
+        stats["chunks_used"] = len(selected_chunks)
+        stats["excerpts_used"] = len(selected_excerpts)
+
+        sections = [self.prefix]
+        if selected_chunks:
+            sections.append("## Relevant context:\n" + "\n\n".join(selected_chunks))
+        if selected_excerpts:
+            sections.append("## More about you:\n" + "\n\n".join(selected_excerpts))
+        if closing:
+            sections.append(closing)
+        prompt = "\n\n".join(sections)
+        stats["system_tokens"] = count_tokens(prompt)
+        return prompt, stats
+
+
+def log_usage(stats, response=None, elapsed=None, first_token=None):
+    # One line per request: what the prompt was assembled from and what the API billed
+    parts = [
+        f"system={stats.get('system_tokens')}",
+        f"prefix={stats.get('prefix_tokens')}",
+        f"chunks={stats.get('chunks_used')}",
+        f"excerpts={stats.get('excerpts_used')}",
+    ]
+    if "history_tokens" in stats:
+        # Earlier turns sent with this request, and how they were compacted
+        parts += [
+            f"history={stats['history_tokens']}",
+            f"turns={stats['turns_verbatim']}+{stats['turns_summarized']}summarized",
+            f"turns_dropped={stats['turns_dropped']}",
+            f"tools_dropped={stats['tool_messages_dropped']}",
+        ]
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+        parts += [f"prompt={usage.prompt_tokens}", f"cached={cached}", f"completion={usage.completion_tokens}"]
+    if first_token is not None:
+        parts.append(f"ttft={first_token:.2f}s")
+    if elapsed is not None:
+        parts.append(f"latency={elapsed:.2f}s")
+    print("Tokens: " + " ".join(parts), flush=True)
+
+
+if __name__ == "__main__":
+    print(f"Cached the {CHAT_MODEL} tokenizer at {fetch_encoding()}")
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from openai import APIError
+
+from background import writer
+from database import get_query_embedding, normalize_question, put_query_embedding, touch_query_embedding
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+MEMORY_ENTRIES = 1024
+DISK_ENTRIES = 50000
+# Trimming the table to DISK_ENTRIES sorts it, so only do it every so many writes
+PRUNE_EVERY = 100
+# A question embedding slower than this is abandoned and retrieval goes lexical-only
+EMBEDDING_TIMEOUT = 3.0
+# After a failed request the API is skipped for this long, instead of every question
+# paying the timeout while it is down
+FAILURE_COOLDOWN_SECONDS = 30
+
+
+class QueryEmbeddingCache:
+    """Two-level cache of question embeddings: an in-memory LRU over a SQLite table.
+
+    Keys are the normalized question text plus the model, so "Tell me about MintLang?"
+    and "tell me about mintlang" share one entry, and entries made with another
+    model are never returned. The SQLite level survives restarts and is shared by
+    every process using the same database; it is trimmed by last use, which disk
+    hits refresh. Writes to it go through the background writer, so a lookup only
+    ever reads from SQLite.
+    """
+
+    def __init__(self, max_entries=MEMORY_ENTRIES, max_disk_entries=DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._unavailable_until = 0.0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key, embedding):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_memory(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+            return embedding
+
+    def _get_disk(self, key):
+        blob = get_query_embedding(*key)
+        if blob is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        embedding = np.frombuffer(blob, dtype=np.float32)
+        self._remember(key, embedding)
+        with self._lock:
+            self.disk_hits += 1
+        writer.submit(touch_query_embedding, *key)
+        return embedding
+
+    def get(self, text, model=EMBEDDING_MODEL):
+        key = (normalize_question(text), model)
+        embedding = self._get_memory(key)
+        return embedding if embedding is not None else self._get_disk(key)
+
+    async def aget(self, text, model=EMBEDDING_MODEL):
+        # Memory hits are answered inline; the SQLite read runs in a worker thread
+        key = (normalize_question(text), model)
+        embedding = self._get_memory(key)
+        return embedding if embedding is not None else await asyncio.to_thread(self._get_disk, key)
+
+    def put(self, text, embedding, model=EMBEDDING_MODEL):
+        key = (normalize_question(text), model)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self._remember(key, embedding)
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        # Persisted off the caller's path; the write may wait on busy_timeout
+        writer.submit(put_query_embedding, *key, embedding.tobytes(), max_entries=self.max_disk_entries if prune else None)
+        return embedding
+
+    def embed(self, client, text, model=EMBEDDING_MODEL):
+        # Returns the cached embedding, calling the API only on a miss
+        embedding = self.get(text, model)
+        if embedding is None:
+            response = client.embeddings.create(model=model, input=text)
+            embedding = self.put(text, response.data[0].embedding, model)
+        return embedding
+
+    async def aembed(self, async_client, text, model=EMBEDDING_MODEL):
+        embedding = await self.aget(text, model)
+        if embedding is None:
+            response = await async_client.embeddings.create(model=model, input=text)
+            embedding = self.put(text, response.data[0].embedding, model)
+        return embedding
+
+    def _api_available(self, offline):
+        return not offline and time.time() >= self._unavailable_until
+
+    def _api_failed(self, error):
+        self._unavailable_until = time.time() + FAILURE_COOLDOWN_SECONDS
+        print(f"Query embedding failed ({error.__class__.__name__}); using lexical retrieval "
+              f"for {FAILURE_COOLDOWN_SECONDS}s", flush=True)
+
+    def try_embed(self, client, text, model=EMBEDDING_MODEL, timeout=EMBEDDING_TIMEOUT, offline=False):
+        # Like embed(), but returns None instead of waiting on a slow or failing API.
+        # offline=True only consults the cache, so no request is ever made
+        embedding = self.get(text, model)
+        if embedding is not None or not self._api_available(offline):
+            return embedding
+        try:
+            response = client.with_options(timeout=timeout, max_retries=0).embeddings.create(model=model, input=text)
+        except APIError as e:
+            self._api_failed(e)
+            return None
+        return self.put(text, response.data[0].embedding, model)
+
+    async def atry_embed(self, async_client, text, model=EMBEDDING_MODEL, timeout=EMBEDDING_TIMEOUT, offline=False):
+        embedding = await self.aget(text, model)
+        if embedding is not None or not self._api_available(offline):
+            return embedding
+        try:
+            response = await async_client.with_options(timeout=timeout, max_retries=0).embeddings.create(
+                model=model, input=text
+            )
+        except APIError as e:
+            self._api_failed(e)
+            return None
+        return self.put(text, response.data[0].embedding, model)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+query_cache = QueryEmbeddingCache()
@@ -1,14 +1,24 @@
 from dotenv import load_dotenv
-from openai import OpenAI
-import json
+from openai import OpenAI, AsyncOpenAI
+import asyncio
 import os
-import requests
-from pypdf import PdfReader
-import gradio as gr
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity 
-from database import get_answer, add_unknown_question, add_qa, get_session, add_session, save_unknown_question, increment_questions
+import threading
+
+# Before the project imports: their module-level settings read the environment
+load_dotenv(override=True)
+
+from database import DEFAULT_TENANT, get_answer, add_qa, add_unknown_question, consume_question
+from semantic_cache import SemanticCache
+from retrieval import RETRIEVAL_MODE, RetrievalEngine, get_engine
+from embedding_providers import OpenAIProvider, provider_for_index
+from prompting import CHAT_MODEL, PromptBuilder, log_usage
+from background import writer
+from notifications import NotificationDispatcher
+from tool_registry import ToolRegistry
+from tenants import DEFAULT, TenantRegistry, UnknownTenant
+from history import HistoryCompactor
 import uuid
+import time
 ADMIN_SESSION_ID = "monisha_admin" 
 MAX_QUESTIONS = 5
 
@@ -26,7 +36,7 @@ def add_user_message(message, history):
     history = (history or []) + [{"role": "user", "content": message}]
     return history, ""
 
-def bot_respond(history, state):
+async def bot_respond(history, state, tenant_id=None):
     last_user = ""
     for m in reversed(history or []):
         if m["role"] == "user":
@@ -34,199 +44,206 @@ def bot_respond(history, state):
             break
 
     history_wo_last = (history or [])[:-1]
-    answer, state = me.chat(last_user, history_wo_last, state)
-
-    
-    history = history + [{"role": "assistant", "content": answer}]
-    return history, state
-
-
-load_dotenv(override=True)
-
-HF_TOKEN = os.getenv("HF_TOKEN")
-print("HF_TOKEN:", os.getenv("HF_TOKEN"))
-
-headers = {"Authorization": f"Bearer {HF_TOKEN}"}
-response = requests.get("https://huggingface.co/api/whoami-v2", headers=headers)
-print("Status code is", response.status_code)
-
-from huggingface_hub import HfApi
-
-api = HfApi()
-token_info = api.whoami(token=HF_TOKEN)
-if "scope" in token_info:
-    scopes = token_info["scope"]
-    print(scopes)
-
-def push(text):
-    requests.post(
-        "https://api.pushover.net/1/messages.json",
-        data={
-            "token": os.getenv("PUSHOVER_TOKEN"),
-            "user": os.getenv("PUSHOVER_USER"),
-            "message": text,
-        }
-    )
-
-def record_user_details(email, name="Name not provided", notes="not provided"):
-    push(f"Recording {name} with email {email} and notes {notes}")
+    history = history + [{"role": "assistant", "content": ""}]
+
+    # A session talks to the portfolio it started on (?tenant=<id> in the URL)
+    state = state if state is not None else {}
+    tenant_id = state.setdefault("tenant", tenant_id or DEFAULT_TENANT)
+    try:
+        me = await asyncio.to_thread(get_me, tenant_id)
+    except UnknownTenant:
+        history[-1]["content"] = f"Sorry, there's no portfolio called {tenant_id!r} here."
+        yield history, state
+        return
+
+    # Async generator handler: Gradio re-renders the chat on every yield as tokens
+    # arrive, and one worker interleaves many sessions while they wait on the API
+    async for answer, state in me.achat_stream(last_user, history_wo_last, state):
+        history[-1]["content"] = answer
+        yield history, state
+
+
+def check_hf_token(token=None):
+    # Optional sanity check of the Hugging Face token; never runs at import time
+    token = token or os.getenv("HF_TOKEN")
+    if not token:
+        print("HF_TOKEN not set; skipping Hugging Face token check", flush=True)
+        return None
+    from huggingface_hub import HfApi
+
+    try:
+        token_info = HfApi().whoami(token=token)
+    except Exception as e:
+        print(f"Hugging Face token check failed: {e}", flush=True)
+        return None
+    print(f"Hugging Face token OK for {token_info.get('name')}", flush=True)
+    if "scope" in token_info:
+        print(token_info["scope"], flush=True)
+    return token_info
+
+notifier = NotificationDispatcher(os.getenv("PUSHOVER_TOKEN"), os.getenv("PUSHOVER_USER"))
+
+def push(text, tenant=DEFAULT_TENANT):
+    # Queued in the outbox and delivered by the dispatcher thread; never blocks the answer
+    notifier.notify(text if tenant == DEFAULT_TENANT else f"[{tenant}] {text}")
+
+registry = ToolRegistry()
+
+@registry.tool(
+    "Use this tool to record that a user is interested in being in touch and provided an email address",
+    properties={
+        "email": "The email address of this user",
+        "name": "The user's name, if they provided it",
+        "notes": "Any additional information about the conversation that's worth recording to give context",
+    },
+    required=["email"],
+)
+def record_user_details(email, name="Name not provided", notes="not provided", tenant=DEFAULT_TENANT):
+    push(f"Recording {name} with email {email} and notes {notes}", tenant)
     return {"recorded": "ok"}
 
-def record_unknown_question(question):
-    push(f"Recording {question}")
+@registry.tool(
+    "Always use this tool to record any question that couldn't be answered as you didn't know the answer",
+    properties={"question": "The question that couldn't be answered"},
+    required=["question"],
+)
+def record_unknown_question(question, tenant=DEFAULT_TENANT):
+    push(f"Recording {question}", tenant)
     return {"recorded": "ok"}
 
-record_user_details_json = {
-    "name": "record_user_details",
-    "description": "Use this tool to record that a user is interested in being in touch and provided an email address",
-    "parameters": {
-        "type": "object",
-        "properties": {
-            "email": {
-                "type": "string",
-                "description": "The email address of this user"
-            },
-            "name": {
-                "type": "string",
-                "description": "The user's name, if they provided it"
-            }
-            ,
-            "notes": {
-                "type": "string",
-                "description": "Any additional information about the conversation that's worth recording to give context"
-            }
-        },
-        "required": ["email"],
-        "additionalProperties": False
-    }
-}
-
-record_unknown_question_json = {
-    "name": "record_unknown_question",
-    "description": "Always use this tool to record any question that couldn't be answered as you didn't know the answer",
-    "parameters": {
-        "type": "object",
-        "properties": {
-            "question": {
-                "type": "string",
-                "description": "The question that couldn't be answered"
-            },
-        },
-        "required": ["question"],
-        "additionalProperties": False
-    }
-}
-
-tools = [{"type": "function", "function": record_user_details_json},
-         {"type": "function", "function": record_unknown_question_json}]
-
-
-def chunk_text(text, max_length=500):  
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + max_length
-        chunks.append(text[start:end])
-        start = end
-    return chunks
-
-
-def load_chunks_and_embeddings(resume_text, github_text):
-    with open("me/summary2.txt", "r", encoding="utf-8") as f:
-        summary_text = f.read()
-
-    combined_text = resume_text + "\n\n" + summary_text + "\n\n" + github_text
-    chunks = chunk_text(combined_text)
-
-    with open("me/embeddings.json", "r", encoding="utf-8") as f:
-        embeddings = json.load(f)
-
-    return chunks, embeddings
+tools = registry.schemas()
 
 
+def load_chunks_and_embeddings():
+    # Chunk text and vectors come from the same index artifact built by embeddings.py
+    from embeddings import load_serving_index
+    index = load_serving_index(DEFAULT)
+    return index.texts, index.vectors
 
-def find_similar_chunks(question_embedding, chunks, embeddings, top_k=3):
-    embeddings_np = np.array(embeddings)
-    question_emb_np = np.array(question_embedding).reshape(1, -1)
-    similarities = cosine_similarity(question_emb_np, embeddings_np)[0]
 
-    top_k = min(top_k, len(chunks)) 
 
-    top_indices = similarities.argsort()[-top_k:][::-1]
-    return [chunks[i] for i in top_indices]
+def find_similar_chunks(question_embedding, chunks, embeddings, top_k=3):
+    return [chunk for chunk, _ in get_engine(chunks, embeddings).search(question_embedding, top_k=top_k)]
 
 class Me:
 
-    def __init__(self, chunks, embeddings):
-        self.openai = OpenAI()
-        self.name = "Monisha Krishnamurthy"
+    def __init__(self, chunks, embeddings, retriever=None, provider=None, tenant=None, openai=None, async_openai=None):
+        # Tenants loaded by the registry share one pair of API clients
+        self.openai = openai or OpenAI()
+        self.async_openai = async_openai or AsyncOpenAI()
+        # Embeds questions; must be the provider that built the index (see provider_for_index)
+        self.provider = provider or OpenAIProvider(client=self.openai, async_client=self.async_openai)
+        self.tenant = tenant or DEFAULT
+        self.name = self.tenant.name
         self.chunks = chunks
         self.embeddings = embeddings
-
-        reader = PdfReader("me/MKM_Master_Resume.pdf")
-        self.resume = ""
-        for page in reader.pages:
-            text = page.extract_text()
-            if text:
-                self.resume += text
-        with open("me/summary2.txt", "r", encoding="utf-8") as f:
-            self.summary = f.read()
-        with open("me/github_profile.txt", "r", encoding="utf-8") as f:
-            self.github_profile = f.read()
+        # Pass a retriever built with RetrievalEngine.from_index to pick up a persisted ANN index
+        self.retriever = retriever or get_engine(chunks, embeddings)
+        self.answer_cache = SemanticCache(threshold=self.provider.similarity_threshold, tenant=self.tenant.tenant_id)
+        self.answer_cache.warm()
+
+        # The resume and GitHub profile reach the prompt as retrieved chunks (from the
+        # offline fallback index until embeddings.py has been run); the summary tops
+        # up the prompt when retrieval leaves budget unused
+        self.summary = self.tenant.read_summary()
+        self.prompt_builder = PromptBuilder(self.persona_prompt(), summary=self.summary)
+        # Earlier turns: the latest verbatim, older ones folded into a per-session summary
+        self.history = HistoryCompactor(self.openai, self.tenant.first_name)
 
     def handle_tool_call(self, tool_calls):
-        results = []
-        for tool_call in tool_calls:
-            tool_name = tool_call.function.name
-            arguments = json.loads(tool_call.function.arguments)
-            print(f"Tool called: {tool_name}", flush=True)
-            tool = globals().get(tool_name)
-            result = tool(**arguments) if tool else {}
-            results.append({"role": "tool", "content": json.dumps(result), "tool_call_id": tool_call.id})
-        return results
-
-    def system_prompt(self, context=""):
-        system_prompt = f"""You ARE {self.name}. You are NOT an AI assistant - you are Monisha Krishnamurthy speaking directly to someone.
+        # tool_calls are the dicts assembled from the streamed deltas; independent calls run concurrently
+        return registry.run(tool_calls, tenant=self.tenant.tenant_id)
+
+    def persona_prompt(self):
+        # Identical on every request; the retrieved context is appended after it
+        return f"""You ARE {self.name}. You are NOT an AI assistant - you are {self.name} speaking directly to someone.
 
         Your personality and communication style:
-        - You're enthusiastic about technology and love sharing your passion for coding
-        - You speak with genuine excitement about your projects, especially MintLang
-        - You're humble but confident about your skills and achievements
-        - You use natural, conversational language - no corporate jargon or AI-like responses
-        - You might use phrases like "I actually built..." or "What I really enjoyed about that project was..."
-        - You're approachable and friendly, like talking to a colleague
-        - You share personal insights and motivations behind your work
-        - You're honest about what you know and don't know
-        - You might mention tennis as a way you approach problem-solving
-
-        Answer questions about your background, skills, experience, and projects using your resume, summary, and GitHub profile. 
+{self.tenant.style(indent="        ")}
+
+        Answer questions about your background, skills, experience, and projects using the context below from your own documents. 
         Speak as if you're having a real conversation - be yourself, not a professional AI assistant.
         
         If you don't know something, be honest about it and use the record_unknown_question tool.
-        If someone wants to connect professionally, ask for their email and use the record_user_details tool.
-
-        ## Your Background:
-        {self.summary}
-
-        ## Your Resume:
-        {self.resume}
-
-        ## Your GitHub Projects:
-        {self.github_profile}
-
-        ## Relevant context:
-        {context}
-
-        Remember: You ARE Monisha. Speak as yourself, not as an AI representing Monisha."""
-    
-        return system_prompt
-
-    def chat(self, message, history, state=None):
+        If someone wants to connect professionally, ask for their email and use the record_user_details tool."""
+
+    def system_prompt(self, chunks=()):
+        # Returns the prompt and its token accounting
+        return self.prompt_builder.build(
+            chunks, closing=f"Remember: You ARE {self.tenant.first_name}. Speak as yourself, not as an AI representing {self.tenant.first_name}."
+        )
+
+    @staticmethod
+    def _merge_tool_call_deltas(tool_calls, delta):
+        # Tool calls arrive as fragments keyed by index and are stitched back together here
+        for call in delta.tool_calls or []:
+            entry = tool_calls.setdefault(call.index, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+            if call.id:
+                entry["id"] = call.id
+            if call.function and call.function.name:
+                entry["function"]["name"] += call.function.name
+            if call.function and call.function.arguments:
+                entry["function"]["arguments"] += call.function.arguments
+
+    def stream_completion(self, messages, prompt_stats):
+        # Yields content deltas as they arrive; returns (content, tool_calls) when the stream ends
+        started = time.perf_counter()
+        first_token = None
+        content = []
+        tool_calls = {}
+        usage_chunk = None
+        stream = self.openai.chat.completions.create(
+            model=CHAT_MODEL, messages=messages, tools=tools, stream=True, stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            if chunk.usage:
+                usage_chunk = chunk
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                content.append(delta.content)
+                yield delta.content
+            self._merge_tool_call_deltas(tool_calls, delta)
+        log_usage(prompt_stats, usage_chunk, time.perf_counter() - started, first_token=first_token)
+        return "".join(content), [tool_calls[i] for i in sorted(tool_calls)]
+
+    async def astream_completion(self, messages, prompt_stats, result):
+        # Async form of stream_completion; async generators can't return, so the
+        # final (content, tool_calls) is stored in result["completion"]
+        started = time.perf_counter()
+        first_token = None
+        content = []
+        tool_calls = {}
+        usage_chunk = None
+        stream = await self.async_openai.chat.completions.create(
+            model=CHAT_MODEL, messages=messages, tools=tools, stream=True, stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                usage_chunk = chunk
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                content.append(delta.content)
+                yield delta.content
+            self._merge_tool_call_deltas(tool_calls, delta)
+        log_usage(prompt_stats, usage_chunk, time.perf_counter() - started, first_token=first_token)
+        result["completion"] = ("".join(content), [tool_calls[i] for i in sorted(tool_calls)])
+
+    def start_turn(self, message, state):
+        # Session bookkeeping shared by both pipelines. Returns (state, reply); reply is
+        # set when the turn ends here (admin command, quota spent)
     # Admin command override
         if message.strip().lower() == "/admin":
             state = state or {}
             state["session_id"] = ADMIN_SESSION_ID
-            return "Admin mode enabled for this session.", state
+            return state, "Admin mode enabled for this session."
 
     # If session_id 
         if state is None:
@@ -235,92 +252,213 @@ class Me:
         
         if session_id is None:
             session_id = str(uuid.uuid4())
-            add_session(session_id)
             state["session_id"] = session_id
 
-    # Only enforce limit for non-admin sessions
+    # Only enforce limit for non-admin sessions; consume_question creates the session row on first use
         if session_id != ADMIN_SESSION_ID:
-            session = get_session(session_id)
-            if session:
-                _, questions_asked = session
-                if questions_asked >= MAX_QUESTIONS:
-                    return f"You have reached the {MAX_QUESTIONS}-question limit.", state
-                else:                
-                    increment_questions(session_id)
+            if consume_question(session_id, MAX_QUESTIONS) is None:
+                return state, f"You have reached the {MAX_QUESTIONS}-question limit."
+        return state, None
+
+    def build_messages(self, question_embedding, history, user_message, session_id=None):
+        # Exact terms and the embedding both vote; with no embedding this is lexical-only
+        relevant_chunks = self.retriever.search_hybrid(user_message, question_embedding, top_k=3)
+    # 3. Prepare system prompt with retrieved context, within the token budget
+        system_prompt, prompt_stats = self.system_prompt([chunk for chunk, _ in relevant_chunks])
+        history_messages, history_stats = self.history.compact(session_id, history)
+        prompt_stats.update(history_stats)
+        messages = [{"role": "system", "content": system_prompt}] + history_messages + [{"role": "user", "content": user_message}]
+        return messages, prompt_stats
+
+    def finish_turn(self, user_message, question_embedding, final_answer, used_tools=False):
+    # 4. Save Q&A to DB along with the question embedding for semantic lookups. A turn
+    # that ran a tool answered one visitor ("Thanks Alice, I've noted alice@acme.com")
+    # and must never be replayed to another, who would also skip the tool call
+        if not used_tools:
+            if question_embedding is not None:
+                self.answer_cache.add(user_message, question_embedding, final_answer)
             else:
-                add_session(session_id)
-                increment_questions(session_id)
+                add_qa(user_message, final_answer, tenant=self.tenant.tenant_id)
+
+    # 5. If unknown answer, log it
+        if "I don't know" in final_answer or "Sorry" in final_answer:
+            add_unknown_question(user_message, tenant=self.tenant.tenant_id)
+
+    def chat_stream(self, message, history, state=None):
+        # Yields (answer_so_far, state) while the reply streams in
+        state, reply = self.start_turn(message, state)
+        if reply:
+            yield reply, state
+            return
 
         user_message = message  # store original user text
 
     # 1. Check if question is already answered in DB
-        answer = get_answer(user_message)
+        answer = get_answer(user_message, tenant=self.tenant.tenant_id)
         if answer:
-            return answer, state # Return cached answer immediately
-
-    # 2. Embed question for RAG retrieval
-        question_embedding_response = self.openai.embeddings.create(model="text-embedding-3-small", input=user_message)
-        question_embedding = question_embedding_response.data[0].embedding
-
-        relevant_chunks = find_similar_chunks(question_embedding, self.chunks, self.embeddings, top_k=3)
-        context = "\n\n".join(relevant_chunks)
+            yield answer, state # Return cached answer immediately
+            return
 
-    # 3. Prepare system prompt with retrieved context
-        system_prompt = self.system_prompt(context=context)
+    # 2. Embed question for RAG retrieval (repeat questions come from the query embedding cache).
+    # None when the API is slow or down, or in lexical mode: retrieval then runs on BM25 alone.
+    # A local provider embeds on the CPU and never makes a network call
+        question_embedding = self.provider.try_embed_query(user_message, offline=RETRIEVAL_MODE == "lexical")
 
-        messages = [{"role": "system", "content": system_prompt}] + (history or []) + [{"role": "user", "content": user_message}
-]
+    # Reuse the answer to a paraphrase of this question if one is cached
+        answer = self.answer_cache.lookup(question_embedding) if question_embedding is not None else None
+        if answer:
+            yield answer, state
+            return
+
+        messages, prompt_stats = self.build_messages(question_embedding, history, user_message, state.get("session_id"))
+
+        final_answer = ""
+        used_tools = False
+        while True:
+            stream = self.stream_completion(messages, prompt_stats)
+            while True:
+                try:
+                    delta = next(stream)
+                except StopIteration as finished:
+                    content, tool_calls = finished.value
+                    break
+                final_answer += delta
+                yield final_answer, state
+            if not tool_calls:
+                break
+            used_tools = True
+            messages.append({"role": "assistant", "content": content or None, "tool_calls": tool_calls})
+            messages.extend(self.handle_tool_call(tool_calls))
+
+        # Persist once the stream is done, off the response path
+        writer.submit(self.finish_turn, user_message, question_embedding, final_answer, used_tools)
+        self.history.submit_refresh(
+            state.get("session_id"),
+            (history or []) + [{"role": "user", "content": user_message}, {"role": "assistant", "content": final_answer}],
+        )
+
+        if not final_answer:
+            yield final_answer, state
+
+    async def achat_stream(self, message, history, state=None):
+        # Async pipeline: blocking SQLite calls run in worker threads, the exact-match
+        # cache probe overlaps the query embedding request, and persistence happens
+        # on the background writer after the answer has been streamed
+        state, reply = await asyncio.to_thread(self.start_turn, message, state)
+        if reply:
+            yield reply, state
+            return
+
+        user_message = message
+
+        cache_probe = asyncio.create_task(asyncio.to_thread(get_answer, user_message, self.tenant.tenant_id))
+        embedding_request = asyncio.create_task(
+            self.provider.atry_embed_query(user_message, offline=RETRIEVAL_MODE == "lexical")
+        )
+        answer = await cache_probe
+        if answer:
+            embedding_request.cancel()
+            yield answer, state
+            return
+        question_embedding = await embedding_request
 
+        answer = self.answer_cache.lookup(question_embedding) if question_embedding is not None else None
+        if answer:
+            yield answer, state
+            return
+
+        messages, prompt_stats = self.build_messages(question_embedding, history, user_message, state.get("session_id"))
+
+        final_answer = ""
+        used_tools = False
+        while True:
+            result = {}
+            async for delta in self.astream_completion(messages, prompt_stats, result):
+                final_answer += delta
+                yield final_answer, state
+            content, tool_calls = result["completion"]
+            if not tool_calls:
+                break
+            used_tools = True
+            messages.append({"role": "assistant", "content": content or None, "tool_calls": tool_calls})
+            messages.extend(await asyncio.to_thread(self.handle_tool_call, tool_calls))
+
+        writer.submit(self.finish_turn, user_message, question_embedding, final_answer, used_tools)
+        self.history.submit_refresh(
+            state.get("session_id"),
+            (history or []) + [{"role": "user", "content": user_message}, {"role": "assistant", "content": final_answer}],
+        )
+
+        if not final_answer:
+            yield final_answer, state
 
-        done = False
-        while not done:
-            response = self.openai.chat.completions.create(model="gpt-4o-mini", messages=messages, tools=tools)
-            if response.choices[0].finish_reason == "tool_calls":
-                tool_message = response.choices[0].message
-                tool_calls = tool_message.tool_calls
-                results = self.handle_tool_call(tool_calls)
-                messages.append(tool_message)
-                messages.extend(results)
-            else:
-                done = True
+    def chat(self, message, history, state=None):
+        # Blocking form of chat_stream: returns the complete answer
+        answer = ""
+        for answer, state in self.chat_stream(message, history, state):
+            pass
+        return answer, state
+
+_clients = None
+_clients_lock = threading.Lock()
+
+def get_clients():
+    # One pair of API clients (and their connection pools) shared by every tenant
+    global _clients
+    with _clients_lock:
+        if _clients is None:
+            _clients = (OpenAI(), AsyncOpenAI())
+        return _clients
+
+def build_me(tenant):
+    # Loads a tenant's index and builds its bot; called by the registry on first use
+    # Imported here: the index build pipeline (PDF parsing, chunking) stays off the import path
+    from embeddings import load_serving_index
+    index = load_serving_index(tenant)
+    openai, async_openai = get_clients()
+    # Refuses to load if EMBEDDING_PROVIDER disagrees with the provider that built the index
+    provider = provider_for_index(
+        index.meta, dim=index.vectors.shape[1], client=openai, async_client=async_openai
+    )
+    return Me(
+        index.texts, index.vectors, retriever=RetrievalEngine.from_index(index), provider=provider,
+        tenant=tenant, openai=openai, async_openai=async_openai,
+    )
 
-        final_answer = str(response.choices[0].message.content)
+tenants = TenantRegistry.from_file(factory=build_me)
 
-    # 4. Save Q&A to DB 
-        add_qa(user_message, final_answer)
+def get_me(tenant_id=DEFAULT_TENANT):
+    # The tenant's bot, loaded on first use and unloaded when idle or least recently used
+    return tenants.load(tenant_id)
 
-    # 5. If unknown answer, log it
-        if "I don't know" in final_answer or "Sorry" in final_answer:
-            add_unknown_question(user_message)
+# Conversations one worker streams at once. Gradio's default is 1 per event listener,
+# which would queue every other user behind the current answer
+CHAT_CONCURRENCY = int(os.getenv("CHAT_CONCURRENCY", "32"))
 
-        return final_answer, state
+def build_demo():
+    import gradio as gr
 
-if __name__ == "__main__":
-    reader = PdfReader("me/MKM_Master_Resume.pdf")
-    resume_text = "".join([p.extract_text() for p in reader.pages if p.extract_text()])
-
-    with open("me/github_profile.txt", "r", encoding="utf-8") as f:
-        github_text = f.read()
-    
-    chunks, embeddings = load_chunks_and_embeddings(resume_text, github_text)
-    me = Me(chunks, embeddings)
     with gr.Blocks() as demo:
-        state = gr.State(value={})  
+        state = gr.State(value={})
         chatbox = gr.Chatbot(type="messages")
         msg = gr.Textbox(placeholder="Type your message here")
-        state = gr.State(value={})
-
-        def respond(message, history, state):
-                answer, state = me.chat(message, history, state)
-                history = (history or []) + [{"role": "user", "content": message}, {"role": "assistant", "content": answer},
-                ]
-                return history, state, ""
-
-       
-        msg.submit(add_user_message, inputs=[msg, chatbox], outputs=[chatbox, msg],).then(bot_respond,inputs=[chatbox, state], outputs=[chatbox, state])
 
+        async def respond(history, state, request: gr.Request):
+            # ?tenant=<id> in the page URL picks the portfolio
+            tenant_id = request.query_params.get("tenant") if request else None
+            async for update in bot_respond(history, state, tenant_id):
+                yield update
 
-    demo.launch()
-  
-
+        msg.submit(add_user_message, inputs=[msg, chatbox], outputs=[chatbox, msg],).then(
+            respond, inputs=[chatbox, state], outputs=[chatbox, state], concurrency_limit=CHAT_CONCURRENCY
+        )
+    return demo
 
+if __name__ == "__main__":
+    # Network checks are opt-in and run off the startup path
+    if os.getenv("CHECK_HF_TOKEN"):
+        threading.Thread(target=check_hf_token, daemon=True).start()
+    # Deliver anything left in the outbox by a previous run
+    notifier.start()
+    get_me()
+    build_demo().launch()
@@ -0,0 +1,152 @@
+import os
+import threading
+
+import numpy as np
+
+from ann_index import ANN_MIN_ROWS, load_ivf
+from lexical_index import BM25Index, load_bm25
+
+# "hybrid" fuses BM25 and vector results; "lexical" never embeds the question, so
+# retrieval makes no network calls at all
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Results taken from each ranker before fusion
+HYBRID_CANDIDATES = 20
+# Reciprocal-rank-fusion constant: larger values flatten the advantage of the top ranks
+RRF_K = 60
+
+
+class RetrievalEngine:
+    """Exact top-k cosine search over a fixed chunk matrix.
+
+    Row norms are computed once at construction. OpenAI embeddings are already unit
+    length, so in the common case the (possibly memory-mapped) matrix is used as-is;
+    otherwise a normalized copy is made once. Scoring is then a single matrix-vector
+    (or matrix-matrix, for batches) product followed by argpartition.
+
+    With an ann (IVFIndex) attached, queries only score the rows in the probed
+    lists; pass exact=True to bypass it.
+
+    search_hybrid() also ranks the chunks with a BM25 index over their text and
+    merges both rankings with reciprocal-rank fusion. Without a query embedding
+    it is lexical-only.
+    """
+
+    def __init__(self, vectors, chunks, ann=None, lexical=None):
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or len(matrix) != len(chunks):
+            raise ValueError(f"Expected one vector per chunk, got {matrix.shape} for {len(chunks)} chunks")
+        norms = np.linalg.norm(matrix, axis=1)
+        if not np.allclose(norms, 1.0, atol=1e-3):
+            matrix = matrix / np.where(norms == 0, 1.0, norms)[:, None]
+        self.matrix = matrix
+        self.chunks = chunks
+        self.ann = ann
+        self.lexical = lexical
+        self._lexical_lock = threading.Lock()
+        # Rows converted from the legacy JSON index carry no text and are never returned
+        self._searchable = np.array([chunk is not None for chunk in chunks], dtype=bool)
+
+    @classmethod
+    def from_index(cls, index):
+        # Large corpora pick up the IVF index persisted next to the vectors, if any
+        ann = None
+        if len(index) >= ANN_MIN_ROWS and index.path:
+            ann = load_ivf(index.path, len(index), index.vectors.shape[1])
+        lexical = load_bm25(index.path, index.texts)
+        return cls(index.vectors, index.texts, ann=ann, lexical=lexical)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @staticmethod
+    def _normalize_queries(query_embeddings):
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        return queries / np.where(norms == 0, 1.0, norms)
+
+    def _top_k(self, scores, top_k, min_score, ids=None):
+        # scores[j] belongs to row ids[j] (all rows when ids is None)
+        searchable = self._searchable if ids is None else self._searchable[ids]
+        scores = np.where(searchable, scores, -np.inf)
+        k = min(top_k, int(searchable.sum()))
+        if k <= 0:
+            return []
+        # argpartition finds the k best in O(n); only those k get sorted
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        ranked = candidates[np.argsort(-scores[candidates])]
+        return [
+            (int(i if ids is None else ids[i]), float(scores[i]))
+            for i in ranked
+            if min_score is None or scores[i] >= min_score
+        ]
+
+    def search_ids(self, query_embedding, top_k=3, min_score=None, n_probe=None, exact=False):
+        # [(row, score), ...] best first
+        return self.search_ids_batch([query_embedding], top_k, min_score, n_probe, exact)[0]
+
+    def search_ids_batch(self, query_embeddings, top_k=3, min_score=None, n_probe=None, exact=False):
+        queries = self._normalize_queries(query_embeddings)
+        if self.ann is None or exact:
+            scores = queries @ self.matrix.T
+            return [self._top_k(row, top_k, min_score) for row in scores]
+        results = []
+        for query in queries:
+            ids = self.ann.candidates(query, n_probe)
+            results.append(self._top_k(self.matrix[ids] @ query, top_k, min_score, ids=ids))
+        return results
+
+    def search(self, query_embedding, top_k=3, min_score=None, n_probe=None, exact=False):
+        # [(chunk, score), ...] best first
+        hits = self.search_ids(query_embedding, top_k, min_score, n_probe, exact)
+        return [(self.chunks[i], score) for i, score in hits]
+
+    def search_batch(self, query_embeddings, top_k=3, min_score=None, n_probe=None, exact=False):
+        return [
+            [(self.chunks[i], score) for i, score in hits]
+            for hits in self.search_ids_batch(query_embeddings, top_k, min_score, n_probe, exact)
+        ]
+
+    def lexical_index(self):
+        # Built from the chunk text on first use when from_index didn't supply one
+        with self._lexical_lock:
+            if self.lexical is None:
+                self.lexical = BM25Index.build(self.chunks)
+            return self.lexical
+
+    def search_lexical_ids(self, query_text, top_k=3):
+        return self.lexical_index().search_ids(query_text, top_k)
+
+    def search_hybrid_ids(self, query_text, query_embedding=None, top_k=3, min_score=None,
+                          candidates=HYBRID_CANDIDATES, rrf_k=RRF_K, n_probe=None, exact=False):
+        # [(row, score), ...] best first. Scores are fused RRF scores, or BM25 scores
+        # when there is no embedding; min_score only filters the vector ranking
+        lexical = self.search_lexical_ids(query_text, max(candidates, top_k))
+        if query_embedding is None:
+            return lexical[:top_k]
+        dense = self.search_ids(query_embedding, max(candidates, top_k), min_score, n_probe, exact)
+        fused = {}
+        for ranking in (dense, lexical):
+            for rank, (row, _) in enumerate(ranking):
+                fused[row] = fused.get(row, 0.0) + 1.0 / (rrf_k + rank + 1)
+        return sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+
+    def search_hybrid(self, query_text, query_embedding=None, top_k=3, min_score=None, **kwargs):
+        # [(chunk, score), ...] best first
+        hits = self.search_hybrid_ids(query_text, query_embedding, top_k, min_score, **kwargs)
+        return [(self.chunks[i], score) for i, score in hits]
+
+
+_engine_lock = threading.Lock()
+_engine_key = None
+_engine = None
+
+
+def get_engine(chunks, embeddings):
+    # Memoizes the engine for the (chunks, embeddings) pair callers keep passing in,
+    # so the function-style wrappers don't redo the normalization on every query
+    global _engine, _engine_key
+    with _engine_lock:
+        if _engine is None or _engine_key[0] is not chunks or _engine_key[1] is not embeddings:
+            _engine = RetrievalEngine(embeddings, chunks)
+            _engine_key = (chunks, embeddings)
+        return _engine
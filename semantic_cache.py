@@ -0,0 +1,150 @@
+import threading
+import time
+
+import numpy as np
+
+from database import DEFAULT_TENANT, add_qa, load_qa_embeddings, normalize_question
+
+# Cosine similarity a new question needs against a cached one to reuse its answer.
+# text-embedding-3-small puts paraphrases like "What is MintLang?" / "what's mintlang"
+# well above this, while different questions about the same project land below it.
+SIMILARITY_THRESHOLD = 0.92
+MAX_ENTRIES = 2048
+# Rows allocated up front; the matrix doubles as entries arrive, up to MAX_ENTRIES
+INITIAL_CAPACITY = 64
+TTL_SECONDS = 7 * 24 * 3600
+
+
+class SemanticCache:
+    """In-memory index of cached question embeddings backed by the qa table.
+
+    Vectors are kept unit-normalized in a float32 matrix, so a lookup is one
+    matrix-vector product. The matrix grows by doubling, so a tenant with few
+    cached answers holds little memory. Entries older than ttl_seconds are skipped
+    and reclaimed; at max_entries the least recently used entry is evicted.
+    Each tenant's answers live in their own namespace of the qa table.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, max_entries=MAX_ENTRIES, ttl_seconds=TTL_SECONDS,
+                 tenant=DEFAULT_TENANT):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.tenant = tenant
+        self._lock = threading.Lock()
+        self._vectors = None
+        capacity = min(INITIAL_CAPACITY, max_entries)
+        self._questions = [None] * capacity
+        self._answers = [None] * capacity
+        self._created = np.zeros(capacity)
+        self._last_used = np.zeros(capacity)
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._slots = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, now):
+        if self.ttl_seconds is None:
+            return
+        expired = self._valid & (self._created < now - self.ttl_seconds)
+        for slot in np.flatnonzero(expired):
+            self._release(slot)
+            self.expirations += 1
+
+    def _release(self, slot):
+        if self._questions[slot] is not None:
+            self._slots.pop(normalize_question(self._questions[slot]), None)
+        self._questions[slot] = None
+        self._answers[slot] = None
+        self._valid[slot] = False
+
+    def _grow(self):
+        capacity = len(self._valid)
+        extra = min(capacity, self.max_entries - capacity)
+        self._vectors = np.concatenate([self._vectors, np.zeros((extra, self._vectors.shape[1]), dtype=np.float32)])
+        self._questions.extend([None] * extra)
+        self._answers.extend([None] * extra)
+        self._created = np.concatenate([self._created, np.zeros(extra)])
+        self._last_used = np.concatenate([self._last_used, np.zeros(extra)])
+        self._valid = np.concatenate([self._valid, np.zeros(extra, dtype=bool)])
+
+    def _insert(self, question, vector, answer, created):
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            # First entry, or the embedding model changed: start a fresh matrix
+            self._vectors = np.zeros((len(self._valid), vector.shape[0]), dtype=np.float32)
+            self._valid[:] = False
+            self._slots.clear()
+        key = normalize_question(question)
+        slot = self._slots.get(key)
+        if slot is None:
+            free = np.flatnonzero(~self._valid)
+            if not len(free) and len(self._valid) < self.max_entries:
+                self._grow()
+                free = np.flatnonzero(~self._valid)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+                self._release(slot)
+                self.evictions += 1
+        self._vectors[slot] = vector
+        self._questions[slot] = question
+        self._answers[slot] = answer
+        self._created[slot] = created
+        self._last_used[slot] = created
+        self._valid[slot] = True
+        self._slots[key] = slot
+
+    def warm(self):
+        # Load persisted question vectors from the qa table, newest first
+        since = time.time() - self.ttl_seconds if self.ttl_seconds is not None else None
+        rows = load_qa_embeddings(since=since, limit=self.max_entries, tenant=self.tenant)
+        with self._lock:
+            for question, answer, blob, created_at in reversed(rows):
+                vector = self._normalize(np.frombuffer(blob, dtype=np.float32))
+                self._insert(question, vector, answer, created_at or time.time())
+        return len(rows)
+
+    def lookup(self, embedding):
+        vector = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0] or not self._valid.any():
+                self.misses += 1
+                return None
+            scores = self._vectors @ vector
+            scores[~self._valid] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._last_used[best] = now
+            self.hits += 1
+            return self._answers[best]
+
+    def add(self, question, embedding, answer):
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._insert(question, vector, answer, time.time())
+        add_qa(question, answer, embedding=vector.tobytes(), tenant=self.tenant)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": int(self._valid.sum()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
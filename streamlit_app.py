@@ -2,22 +2,29 @@ import os
 import streamlit as st
 from dotenv import load_dotenv
 from openai import OpenAI
-import json
-import requests
-from pypdf import PdfReader
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity 
-from database import get_answer, add_unknown_question, add_qa, get_session, add_session, save_unknown_question, increment_questions
-import uuid
+import time
 
-# Load environment variables (for local development)
+# Load environment variables (for local development). Before the project imports:
+# their module-level settings read the environment
 load_dotenv(override=True)
 
+from database import DEFAULT_TENANT, get_answer, add_unknown_question, add_qa, consume_question
+from embeddings import load_serving_index
+from retrieval import RETRIEVAL_MODE, RetrievalEngine
+from embedding_providers import EmbeddingProviderMismatch, provider_for_index
+from notifications import NotificationDispatcher
+from semantic_cache import SIMILARITY_THRESHOLD, SemanticCache
+from tenants import IDLE_SECONDS, MAX_LOADED_TENANTS, load_tenants
+import uuid
+
 # Configuration
 ADMIN_SESSION_ID = "monisha_admin" 
 MAX_QUESTIONS = 5
+RETRIEVAL_TOP_K = 4
 
-# Initialize OpenAI client - use Streamlit secrets if available, otherwise fall back to env vars
+# Initialize OpenAI client - use Streamlit secrets if available, otherwise fall back to env vars.
+# Cached for the life of the process: shared across reruns and sessions
+@st.cache_resource(show_spinner=False)
 def get_openai_client():
     """Get OpenAI client with API key from Streamlit secrets or environment variables"""
     api_key = None
@@ -39,75 +46,115 @@ def get_openai_client():
     
     return OpenAI(api_key=api_key)
 
-# Initialize OpenAI client
-client = get_openai_client()
+@st.cache_resource(show_spinner=False)
+def load_tenant_configs():
+    """The hosted portfolios from tenants.json, plus the built-in default"""
+    return load_tenants()
+
+# The portfolio this page serves comes from the URL: ?tenant=<id>
+tenant_id = st.query_params.get("tenant", DEFAULT_TENANT)
+tenant = load_tenant_configs().get(tenant_id)
+if tenant is None:
+    st.error(f"There's no portfolio called {tenant_id!r} here.")
+    st.stop()
 
-# Load embeddings and documents
-def load_documents():
+# Load embeddings and documents per tenant. The tenant's fingerprint is part of the cache
+# key, so editing or rebuilding anything in its directory loads fresh copies. Stale and
+# idle tenants fall out through max_entries (least recently used) and ttl
+@st.cache_resource(show_spinner=False, max_entries=MAX_LOADED_TENANTS, ttl=IDLE_SECONDS)
+def load_documents(tenant_id, fingerprint):
     """Load documents and embeddings for the chatbot"""
+    # Without a built index this is an offline index of the tenant's documents
+    return load_serving_index(load_tenant_configs()[tenant_id])
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_LOADED_TENANTS, ttl=IDLE_SECONDS)
+def load_retriever(tenant_id, fingerprint):
+    """Build the retrieval engine over the loaded index"""
+    index = load_documents(tenant_id, fingerprint)
+    return RetrievalEngine.from_index(index) if index is not None else None
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_LOADED_TENANTS, ttl=IDLE_SECONDS)
+def load_embedding_provider(tenant_id, fingerprint):
+    """The embedding provider that built the index, used to embed questions"""
+    index = load_documents(tenant_id, fingerprint)
+    if index is None:
+        return None
     try:
-        with open("me/embeddings.json", "r") as f:
-            embeddings_data = json.load(f)
-        return embeddings_data
-    except FileNotFoundError:
-        st.warning("Warning: embeddings.json not found. Please ensure the file exists.")
-        return {}
-
-def load_summary():
+        return provider_for_index(index.meta, dim=index.vectors.shape[1], client=get_openai_client())
+    except EmbeddingProviderMismatch as e:
+        # Questions embedded another way can't be compared with the index; search by keyword only
+        st.error(f"{e} Falling back to keyword search.")
+        return None
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_LOADED_TENANTS, ttl=IDLE_SECONDS)
+def load_answer_cache(tenant_id, fingerprint):
+    """Cached answers matched by question embedding, so paraphrases reuse an answer"""
+    provider = load_embedding_provider(tenant_id, fingerprint)
+    threshold = provider.similarity_threshold if provider is not None else SIMILARITY_THRESHOLD
+    answer_cache = SemanticCache(threshold=threshold, tenant=tenant_id)
+    answer_cache.warm()
+    return answer_cache
+
+@st.cache_data(show_spinner=False, max_entries=MAX_LOADED_TENANTS, ttl=IDLE_SECONDS)
+def load_summary(tenant_id, fingerprint):
     """Load the background summary"""
-    try:
-        with open("me/summary2.txt", "r") as f:
-            return f.read().strip()
-    except FileNotFoundError:
-        st.warning("Warning: summary2.txt not found. Please ensure the file exists.")
-        return ""
+    return load_tenant_configs()[tenant_id].read_summary()
 
-# Load data
-embeddings_data = load_documents()
-background_summary = load_summary()
+# Load data. After the first run these are cache hits; the timing shows what each rerun pays
+_load_started = time.perf_counter()
+client = get_openai_client()
+fingerprint = tenant.fingerprint()
+embeddings_data = load_documents(tenant.tenant_id, fingerprint)
+retriever = load_retriever(tenant.tenant_id, fingerprint)
+embedding_provider = load_embedding_provider(tenant.tenant_id, fingerprint)
+answer_cache = load_answer_cache(tenant.tenant_id, fingerprint)
+background_summary = load_summary(tenant.tenant_id, fingerprint)
+load_time_ms = (time.perf_counter() - _load_started) * 1000
 
-def chat(user_message, session_id):
-    """Main chat function that handles user queries"""
+def chat_stream(user_message, session_id):
+    """Main chat function that handles user queries, yielding the answer as it streams in"""
     try:
-        # Check question limit for non-admin users
-        question_count = st.session_state.get("question_count", 0)
-        if session_id != ADMIN_SESSION_ID and question_count >= MAX_QUESTIONS:
-            return f"You've reached the limit of {MAX_QUESTIONS} questions for this session. Please contact me directly for more questions."
+        # Check and consume the question limit for non-admin users in one DB call
+        if session_id != ADMIN_SESSION_ID:
+            remaining = consume_question(session_id, MAX_QUESTIONS)
+            if remaining is None:
+                st.session_state.question_count = MAX_QUESTIONS
+                yield f"You've reached the limit of {MAX_QUESTIONS} questions for this session. Please contact me directly for more questions."
+                return
+            st.session_state.question_count = MAX_QUESTIONS - remaining
+        else:
+            st.session_state.question_count += 1
         
         # Check if we have a cached answer
-        cached_answer = get_answer(user_message)
+        cached_answer = get_answer(user_message, tenant=tenant.tenant_id)
         if cached_answer:
-            increment_questions(session_id)
-            st.session_state.question_count += 1
-            return cached_answer
+            yield cached_answer
+            return
+
+        # Then for a cached answer to a paraphrase of it; the embedding is reused for retrieval
+        query_embedding = embed_question(user_message)
+        if query_embedding is not None:
+            cached_answer = answer_cache.lookup(query_embedding)
+            if cached_answer:
+                yield cached_answer
+                return
         
         # Get relevant context from embeddings
-        context = get_relevant_context(user_message)
+        context = get_relevant_context(user_message, query_embedding)
         
         # Prepare the prompt
-        system_prompt = f"""You ARE Monisha Krishnamurthy. You are NOT an AI assistant - you are Monisha speaking directly to someone.
+        system_prompt = f"""You ARE {tenant.name}. You are NOT an AI assistant - you are {tenant.first_name} speaking directly to someone.
 
         Your personality and communication style:
-        - You're enthusiastic about technology and love sharing your passion for coding
-        - You speak with genuine excitement about your projects, especially MintLang
-        - You're humble but confident about your skills and achievements
-        - You use natural, conversational language - no corporate jargon or AI-like responses
-        - You might use phrases like "I actually built..." or "What I really enjoyed about that project was..."
-        - You're approachable and friendly, like talking to a colleague
-        - You share personal insights and motivations behind your work
-        - You're honest about what you know and don't know
-        - You might mention tennis as a way you approach problem-solving
+{tenant.style(indent="        ")}
 
         Answer questions about your background, skills, experience, and projects using the information below. 
         Speak as if you're having a real conversation - be yourself, not a professional AI assistant.
 
-        Background Information:
-        {background_summary}
-
         Relevant Context:
         {context}
 
-        Remember: You ARE Monisha. Speak as yourself, not as an AI representing Monisha."""
+        Remember: You ARE {tenant.first_name}. Speak as yourself, not as an AI representing {tenant.first_name}."""
 
         # Get response from OpenAI
         messages = [
@@ -115,47 +162,73 @@ def chat(user_message, session_id):
             {"role": "user", "content": user_message}
         ]
         
-        response = client.chat.completions.create(
+        stream = client.chat.completions.create(
             model="gpt-4o-mini",
             messages=messages,
             max_tokens=500,
-            temperature=0.7
+            temperature=0.7,
+            stream=True
         )
         
-        answer = response.choices[0].message.content
-        
-        # Cache the Q&A
-        add_qa(user_message, answer)
-        increment_questions(session_id)
-        st.session_state.question_count += 1
+        answer = ""
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                answer += chunk.choices[0].delta.content
+                yield chunk.choices[0].delta.content
         
-        return answer
+        # Cache the Q&A once the full answer has streamed. This app has no tools, so no
+        # answer carries one visitor's details
+        if query_embedding is not None:
+            answer_cache.add(user_message, query_embedding, answer)
+        else:
+            add_qa(user_message, answer, tenant=tenant.tenant_id)
         
     except Exception as e:
         st.error(f"Error in chat: {e}")
-        return "I apologize, but I encountered an error. Please try again."
+        yield "I apologize, but I encountered an error. Please try again."
+
+def chat(user_message, session_id):
+    """Non-streaming form of chat_stream"""
+    return "".join(chat_stream(user_message, session_id))
+
+def embed_question(query):
+    """Embed the question with the provider that built the index.
+
+    None when the API is slow or down (or in lexical mode): retrieval then runs on
+    BM25 alone and only the exact-match answer cache applies.
+    """
+    if embedding_provider is None:
+        return None
+    return embedding_provider.try_embed_query(query, offline=RETRIEVAL_MODE == "lexical")
 
-def get_relevant_context(query):
+def get_relevant_context(query, query_embedding=None):
     """Get relevant context from embeddings based on user query"""
     try:
-        if not embeddings_data:
+        if retriever is None:
             return background_summary
         
-        # For now, return the background summary since embeddings are just vectors
-        # In a full implementation, you would use the embeddings for semantic search
-        return background_summary
+        # Vector hits below the provider's cutoff are treated as unrelated to the question
+        min_score = embedding_provider.min_retrieval_score if embedding_provider is not None else None
+        hits = retriever.search_hybrid(query, query_embedding, top_k=RETRIEVAL_TOP_K, min_score=min_score)
+        if not hits:
+            # Nothing relevant enough (or an index without chunk text): fall back to the summary
+            return background_summary
+        return "\n\n".join(chunk for chunk, _ in hits)
             
     except Exception as e:
         st.error(f"Error getting context: {e}")
         return background_summary
 
-def push(text):
-    """Send push notification (optional)"""
-    try:
-        # Try to get from Streamlit secrets first
+_notifier = None
+
+def get_notifier():
+    """Create the push notification dispatcher from Streamlit secrets or environment variables"""
+    global _notifier
+    if _notifier is None:
         pushover_token = None
         pushover_user = None
         
+        # Try to get from Streamlit secrets first
         try:
             if hasattr(st, 'secrets'):
                 pushover_token = st.secrets.get("PUSHOVER_TOKEN")
@@ -169,15 +242,13 @@ def push(text):
         if not pushover_user:
             pushover_user = os.getenv("PUSHOVER_USER")
         
-        if pushover_token and pushover_user:
-            requests.post(
-                "https://api.pushover.net/1/messages.json",
-                data={
-                    "token": pushover_token,
-                    "user": pushover_user,
-                    "message": text,
-                }
-            )
+        _notifier = NotificationDispatcher(pushover_token, pushover_user)
+    return _notifier
+
+def push(text):
+    """Send push notification (optional); queued and delivered in the background"""
+    try:
+        get_notifier().notify(text)
     except:
         pass  # Silently fail if push notifications aren't configured
 
@@ -189,13 +260,13 @@ def main():
         layout="wide"
     )
     
-    st.title("🚀 Chat with Monisha")
-    st.markdown("""
-    Hi! I'm Monisha Krishnamurthy, a software engineer passionate about building reliable, user-friendly systems. 
-    Ask me anything about my background, projects (especially MintLang!), skills, experience, or career journey!
-    
-    **Note:** Free users are limited to 5 questions per session. Contact me directly for unlimited access.
-    """)
+    st.title(f"🚀 Chat with {tenant.first_name}")
+    intro = tenant.intro or f"Hi! I'm {tenant.name}. Ask me anything about my background, projects, skills, or experience!"
+    # Built unindented: the intro may span lines, and indented lines would render as code
+    st.markdown(
+        f"{intro}\n\n**Note:** Free users are limited to {MAX_QUESTIONS} questions per session. "
+        "Contact me directly for unlimited access."
+    )
     
     # Initialize session state
     if "messages" not in st.session_state:
@@ -219,8 +290,8 @@ def main():
         
         # Get bot response
         with st.chat_message("assistant"):
-            response = chat(prompt, st.session_state.session_id)
-            st.markdown(response)
+            # write_stream renders tokens as they arrive and returns the full text
+            response = st.write_stream(chat_stream(prompt, st.session_state.session_id))
             st.session_state.messages.append({"role": "assistant", "content": response})
     
     # Sidebar with additional info
@@ -228,17 +299,19 @@ def main():
         st.header("Session Info")
         st.write(f"**Session ID:** {st.session_state.session_id[:8]}...")
         st.write(f"**Questions Asked:** {st.session_state.question_count}/{MAX_QUESTIONS}")
+        st.caption(f"Resources loaded in {load_time_ms:.1f} ms this rerun")
         
         if st.button("Clear Chat"):
             st.session_state.messages = []
+            # The quota lives in the DB per session, so a cleared chat starts a new session
+            st.session_state.session_id = str(uuid.uuid4())
             st.session_state.question_count = 0
             st.rerun()
         
         st.markdown("---")
         st.markdown("### About")
-        st.markdown("""
-        This is me, Monisha! I'm a software engineer who loves building things and solving problems. 
-        Ask me about my projects, experience, or anything else!
+        st.markdown(f"""
+        This is me, {tenant.first_name}! Ask me about my projects, experience, or anything else!
         """)
         
         # Show remaining questions
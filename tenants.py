@@ -0,0 +1,216 @@
+import json
+import os
+import re
+import textwrap
+import threading
+import time
+from collections import OrderedDict
+
+from database import DEFAULT_TENANT
+
+# Optional JSON file listing the hosted portfolios (see README); the default tenant is built in
+TENANTS_PATH = os.getenv("TENANTS_PATH", "tenants.json")
+# Tenants kept loaded at once; beyond this the least recently used is unloaded
+MAX_LOADED_TENANTS = int(os.getenv("MAX_LOADED_TENANTS", "8"))
+# Tenants nobody has asked about for this long are unloaded on the next request
+IDLE_SECONDS = 30 * 60
+TENANT_ID_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+# Personality bullets for tenants without a persona file
+GENERIC_STYLE = """\
+- You're enthusiastic about your work and enjoy talking about it
+- You're humble but confident about your skills and achievements
+- You use natural, conversational language - no corporate jargon or AI-like responses
+- You're approachable and friendly, like talking to a colleague
+- You're honest about what you know and don't know"""
+
+
+class UnknownTenant(KeyError):
+    pass
+
+
+class Tenant:
+    """One hosted portfolio: its documents, vector index, persona and answer namespace.
+
+    File names are relative to directory, and the index is built at
+    <directory>/index.npy. tenant_id namespaces the person's cached answers and
+    unknown questions in the shared database.
+    """
+
+    def __init__(self, tenant_id, name, directory, sources, summary=None, persona=None, intro=None):
+        if not TENANT_ID_RE.match(tenant_id):
+            raise ValueError(f"Invalid tenant id {tenant_id!r}: use lowercase letters, digits, '-' and '_'")
+        self.tenant_id = tenant_id
+        self.name = name
+        self.directory = directory
+        self.sources = list(sources)
+        self.summary = summary
+        self.persona = persona
+        self.intro = intro
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["id"], data["name"], data["directory"], data["sources"],
+            summary=data.get("summary"), persona=data.get("persona"), intro=data.get("intro"),
+        )
+
+    @property
+    def first_name(self):
+        return self.name.split()[0]
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    @property
+    def index_path(self):
+        return self.path("index.npy")
+
+    @property
+    def source_paths(self):
+        return [self.path(filename) for filename in self.sources]
+
+    def read_summary(self):
+        if not self.summary:
+            return ""
+        try:
+            with open(self.path(self.summary), "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            print(f"Warning: summary {self.path(self.summary)} not found for tenant {self.tenant_id}", flush=True)
+            return ""
+
+    def style(self, indent=""):
+        # The persona file's personality bullets, or generic ones
+        style = GENERIC_STYLE
+        if self.persona:
+            try:
+                with open(self.path(self.persona), "r", encoding="utf-8") as f:
+                    style = f.read().strip()
+            except FileNotFoundError:
+                print(f"Warning: persona {self.path(self.persona)} not found for tenant {self.tenant_id}", flush=True)
+        return textwrap.indent(style, indent)
+
+    def fingerprint(self):
+        # (name, mtime, size) of every file in the tenant's directory except the database,
+        # whose writes on every answer shouldn't count as a corpus change
+        entries = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith("db.sqlite"):
+                continue
+            stat = os.stat(self.path(name))
+            entries.append((name, stat.st_mtime_ns, stat.st_size))
+        return tuple(entries)
+
+
+DEFAULT = Tenant(
+    DEFAULT_TENANT,
+    "Monisha Krishnamurthy",
+    "me",
+    ["MKM_Master_Resume.pdf", "summary2.txt", "github_profile.txt"],
+    summary="summary2.txt",
+    persona="persona.txt",
+    intro="Hi! I'm Monisha Krishnamurthy, a software engineer passionate about building reliable, user-friendly systems. \n"
+          "Ask me anything about my background, projects (especially MintLang!), skills, experience, or career journey!",
+)
+
+
+def load_tenants(path=TENANTS_PATH):
+    # {tenant_id: Tenant}: the built-in default plus any listed in path, which may replace it
+    tenants = OrderedDict([(DEFAULT.tenant_id, DEFAULT)])
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for entry in data["tenants"] if isinstance(data, dict) else data:
+            tenant = Tenant.from_dict(entry)
+            tenants[tenant.tenant_id] = tenant
+    return tenants
+
+
+class TenantRegistry:
+    """Tenant configs plus an LRU of the tenants currently loaded.
+
+    load() builds a tenant's runtime (index, retriever, answer cache...) with
+    factory(tenant) on first use and reuses it afterwards. At most max_loaded stay
+    in memory: loading another unloads the least recently used, and tenants idle
+    for idle_seconds are unloaded on the next call. Indexes are memory-mapped, so
+    reloading a tenant after an unload mostly reads from the page cache.
+    """
+
+    def __init__(self, tenants, factory, max_loaded=MAX_LOADED_TENANTS, idle_seconds=IDLE_SECONDS):
+        self.tenants = tenants
+        self.factory = factory
+        self.max_loaded = max_loaded
+        self.idle_seconds = idle_seconds
+        self._loaded = OrderedDict()  # tenant_id -> [runtime, last_used]
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.unloads = 0
+
+    @classmethod
+    def from_file(cls, factory, path=TENANTS_PATH, **kwargs):
+        return cls(load_tenants(path), factory, **kwargs)
+
+    def __contains__(self, tenant_id):
+        return tenant_id in self.tenants
+
+    def get(self, tenant_id):
+        tenant = self.tenants.get(tenant_id)
+        if tenant is None:
+            raise UnknownTenant(tenant_id)
+        return tenant
+
+    def _unload(self, tenant_id):
+        self._loaded.pop(tenant_id)
+        self.unloads += 1
+        print(f"Unloaded tenant {tenant_id}", flush=True)
+
+    def _unload_idle(self, now):
+        if self.idle_seconds is None:
+            return
+        for tenant_id, (_, last_used) in list(self._loaded.items()):
+            if now - last_used > self.idle_seconds:
+                self._unload(tenant_id)
+
+    def _cached(self, tenant_id, now):
+        entry = self._loaded.get(tenant_id)
+        if entry is None:
+            return None
+        entry[1] = now
+        self._loaded.move_to_end(tenant_id)
+        return entry[0]
+
+    def load(self, tenant_id):
+        tenant = self.get(tenant_id)
+        with self._lock:
+            now = time.time()
+            self._unload_idle(now)
+            runtime = self._cached(tenant_id, now)
+            if runtime is not None:
+                return runtime
+            loading = self._loading.setdefault(tenant_id, threading.Lock())
+        # One load per tenant at a time; other tenants keep being served meanwhile
+        with loading:
+            with self._lock:
+                runtime = self._cached(tenant_id, time.time())
+            if runtime is not None:
+                return runtime
+            started = time.perf_counter()
+            runtime = self.factory(tenant)
+            print(f"Loaded tenant {tenant_id} in {(time.perf_counter() - started) * 1000:.0f} ms", flush=True)
+            with self._lock:
+                self._loaded[tenant_id] = [runtime, time.time()]
+                self.loads += 1
+                while len(self._loaded) > self.max_loaded:
+                    self._unload(next(iter(self._loaded)))
+        return runtime
+
+    def unload(self, tenant_id):
+        with self._lock:
+            if tenant_id in self._loaded:
+                self._unload(tenant_id)
+
+    def stats(self):
+        with self._lock:
+            return {"configured": len(self.tenants), "loaded": list(self._loaded), "loads": self.loads, "unloads": self.unloads}
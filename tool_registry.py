@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 4
+
+
+class ToolRegistry:
+    """Functions the model may call, with their JSON schemas declared alongside them.
+
+    All tool calls from one model turn are run concurrently on a shared thread pool,
+    so their I/O overlaps; results come back in the order of the tool calls. Each
+    call is timed and aggregated per tool in stats().
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self._tools = {}
+        self._pool = None
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def tool(self, description, properties=None, required=()):
+        # properties maps argument name -> description (a string argument) or a full JSON schema
+        def register(fn):
+            schema_properties = {
+                name: {"type": "string", "description": spec} if isinstance(spec, str) else spec
+                for name, spec in (properties or {}).items()
+            }
+            self._tools[fn.__name__] = (fn, {
+                "name": fn.__name__,
+                "description": description,
+                "parameters": {
+                    "type": "object",
+                    "properties": schema_properties,
+                    "required": list(required),
+                    "additionalProperties": False,
+                },
+            })
+            return fn
+        return register
+
+    def schemas(self):
+        # The `tools` argument for chat.completions.create
+        return [{"type": "function", "function": schema} for _, schema in self._tools.values()]
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool")
+            return self._pool
+
+    def call(self, name, arguments):
+        entry = self._tools.get(name)
+        started = time.perf_counter()
+        try:
+            result = entry[0](**arguments) if entry else {}
+        except Exception as e:
+            print(f"Tool {name} failed: {e}", flush=True)
+            result = {"error": str(e)}
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            stats = self._stats.setdefault(name, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            stats["calls"] += 1
+            stats["total_seconds"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+        print(f"Tool called: {name} ({elapsed * 1000:.1f} ms)", flush=True)
+        return result
+
+    def run(self, tool_calls, **context):
+        # tool_calls: dicts with id and function name/arguments, as assembled from the stream.
+        # context is passed to every tool as keyword arguments (e.g. tenant) and takes
+        # precedence over anything the model sent. Returns the matching "tool" messages in order.
+        def execute(tool_call):
+            arguments = json.loads(tool_call["function"]["arguments"] or "{}")
+            return self.call(tool_call["function"]["name"], {**arguments, **context})
+
+        if len(tool_calls) == 1:
+            results = [execute(tool_calls[0])]
+        else:
+            results = list(self._executor().map(execute, tool_calls))
+        return [
+            {"role": "tool", "content": json.dumps(result), "tool_call_id": tool_call["id"]}
+            for tool_call, result in zip(tool_calls, results)
+        ]
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
@@ -0,0 +1,108 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+# Binary index: a float32 (n_chunks, dim) matrix plus a JSON sidecar describing each row
+INDEX_PATH = "me/index.npy"
+LEGACY_JSON_PATH = "me/embeddings.json"
+
+
+def sidecar_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+class VectorIndex:
+    """Chunk vectors plus per-row chunk records (id, text, source, section, start, end)."""
+
+    def __init__(self, vectors, chunks, meta=None, path=None):
+        self.vectors = vectors
+        self.chunks = chunks
+        self.meta = meta or {}
+        self.path = path
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @property
+    def texts(self):
+        return [chunk["text"] for chunk in self.chunks]
+
+
+def _placeholder_chunks(count):
+    # Rows converted from the legacy format have no recorded chunk text
+    return [{"id": i, "text": None, "source": None, "section": None, "start": None, "end": None} for i in range(count)]
+
+
+def _atomic_write(path, write):
+    # Write next to the target and rename, so a reader never sees a half-written file
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def save_index(vectors, chunks=None, path=INDEX_PATH, **meta):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2:
+        raise ValueError(f"Expected a 2-D embedding matrix, got shape {vectors.shape}")
+    if chunks is None:
+        chunks = _placeholder_chunks(len(vectors))
+    if len(chunks) != len(vectors):
+        raise ValueError(f"Chunks count ({len(chunks)}) != Embeddings count ({len(vectors)})")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def write_vectors(tmp_path):
+        with open(tmp_path, "wb") as f:
+            np.save(f, vectors)
+
+    def write_sidecar(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": int(vectors.shape[1]), "count": len(chunks), "meta": meta, "chunks": chunks}, f)
+
+    _atomic_write(path, write_vectors)
+    _atomic_write(sidecar_path(path), write_sidecar)
+    return VectorIndex(vectors, chunks, meta, path=path)
+
+
+def load_index(path=INDEX_PATH, mmap=True):
+    # mmap_mode="r" maps the matrix straight from disk: no parse, no copy, and pages
+    # are shared between processes serving the same file
+    vectors = np.load(path, mmap_mode="r" if mmap else None, allow_pickle=False)
+    with open(sidecar_path(path), "r", encoding="utf-8") as f:
+        sidecar = json.load(f)
+    if len(sidecar["chunks"]) != len(vectors):
+        raise ValueError(f"{sidecar_path(path)} describes {len(sidecar['chunks'])} chunks but {path} has {len(vectors)} rows")
+    return VectorIndex(vectors, sidecar["chunks"], sidecar.get("meta"), path=path)
+
+
+def convert_json(json_path=LEGACY_JSON_PATH, path=INDEX_PATH, chunks=None):
+    # One-off migration from the old JSON list-of-lists format
+    with open(json_path, "r", encoding="utf-8") as f:
+        embeddings = json.load(f)
+    return save_index(np.asarray(embeddings, dtype=np.float32), chunks=chunks, path=path, converted_from=json_path)
+
+
+def load_corpus(path=INDEX_PATH):
+    # The one loader the serving code uses: chunk text and vectors come from the same
+    # artifact, so row i of the matrix always embeds chunks[i]. It never writes: the
+    # legacy embeddings.json has no chunk text, so converting it (`python vector_store.py`)
+    # is left to the command line
+    index = load_index(path)
+    missing = sum(1 for text in index.texts if text is None)
+    if missing:
+        print(f"Warning: {missing}/{len(index)} rows in {path} have no chunk text and won't be retrieved. "
+              f"Rebuild the index with `python embeddings.py`.", flush=True)
+    return index
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else LEGACY_JSON_PATH
+    target = sys.argv[2] if len(sys.argv) > 2 else INDEX_PATH
+    index = convert_json(source, target)
+    print(f"Converted {len(index)} embeddings ({index.vectors.shape[1]}-dim) from {source} to {target}")